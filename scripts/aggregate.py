@@ -1,31 +1,36 @@
 
 from __future__ import annotations
-import argparse, csv
-from collections import defaultdict
+import argparse, csv, sys
 from pathlib import Path
-import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.results_store import aggregate, store_from_csv
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--csv", required=True)
+    ap.add_argument("--csv", default=None, help="metrics_*.csv from run_experiment (timing_*.csv next to it gives time)")
+    ap.add_argument("--store", default=None, help="results_* directory written with --store")
     ap.add_argument("--out", default="results/summary.csv")
+    ap.add_argument("--to_store", default=None, help="Also convert --csv into a columnar store directory")
+    ap.add_argument("--format", default="auto", choices=["auto", "parquet", "npz"])
     args = ap.parse_args()
-    rows = []
-    with open(args.csv, newline="", encoding="utf-8") as f:
-        rows = [r for r in csv.DictReader(f)]
-    buckets = defaultdict(list)
-    for r in rows:
-        buckets[(r["algo"], int(r["K"]))].append(r)
+    if (args.csv is None) == (args.store is None):
+        ap.error("give exactly one of --csv / --store")
+    if args.to_store:
+        if args.csv is None:
+            ap.error("--to_store converts a --csv")
+        n = store_from_csv(args.csv, args.to_store, args.format)
+        print(f"Converted {n} rows -> {args.to_store}")
+
+    agg = aggregate(args.store or args.csv, metrics=("Dice", "IoU", "sec"))
     out = Path(args.out); out.parent.mkdir(parents=True, exist_ok=True)
     with open(out, "w", newline="", encoding="utf-8") as f:
         wr = csv.writer(f)
         wr.writerow(["algo","K","n","dice_mean","dice_std","iou_mean","iou_std","time_mean","time_std"])
-        for (algo,K), rs in sorted(buckets.items()):
-            dice = np.array([float(r["dice"]) for r in rs])
-            iou = np.array([float(r["iou"]) for r in rs])
-            t = np.array([float(r["time"]) for r in rs])
-            wr.writerow([algo, K, len(rs), dice.mean(), dice.std(), iou.mean(), iou.std(), t.mean(), t.std()])
-    print(f"Saved summary -> {out}")
+        for algo, K, st in agg.summary():
+            n = max(v[0] for v in st.values())
+            wr.writerow([algo, K, n, *st["Dice"][1:], *st["IoU"][1:], *st["sec"][1:]])
+    print(f"Saved summary ({agg.rows} rows) -> {out}")
 
 if __name__ == "__main__":
     main()
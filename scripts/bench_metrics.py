@@ -0,0 +1,48 @@
+from __future__ import annotations
+import argparse, sys, time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.metrics import ssim, ssim_labels, _ssim_float, psnr, psnr_from_confusion, confusion_matrix, label_levels
+
+def bench(fn, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="321x481,584x565,1000x1000")
+    ap.add_argument("--classes", type=int, default=3, help="labels in the predicted map")
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'size':>10} {'metric':>12} {'sec':>10} {'speedup':>8} {'|diff|':>10}")
+    for size in args.sizes.split(","):
+        H, W = (int(v) for v in size.split("x"))
+        seg = rng.integers(0, args.classes, size=(H, W)).astype(np.uint8)
+        seg[: H // 3] = 0
+        gt = (rng.random((H, W)) > 0.8).astype(np.uint8)
+        x, y = seg * (255 // (seg.max() + 1)), gt * (255 // (gt.max() + 1))
+        _ssim_float(x, y)  # nạp scipy trước khi đo
+        t_ref = bench(lambda: _ssim_float(x, y), args.repeat)
+        ref = _ssim_float(x, y)
+        print(f"{size:>10} {'ssim scipy':>12} {t_ref:>10.5f} {1.0:>8.1f} {0.0:>10.2e}")
+        for name, fn in (("ssim", lambda: ssim(x, y)), ("ssim_labels", lambda: ssim_labels(seg, gt))):
+            t = bench(fn, args.repeat)
+            print(f"{size:>10} {name:>12} {t:>10.5f} {t_ref / t:>8.1f} {abs(fn() - ref):>10.2e}")
+        # PSNR của ảnh nhãn: từ ma trận nhầm lẫn (đã có sẵn cho Dice/IoU) thay vì hai ảnh float
+        t_ref = bench(lambda: psnr(x, y), args.repeat)
+        ref = psnr(x, y)
+        cm = confusion_matrix(seg, gt)
+        fn = lambda: psnr_from_confusion(cm, label_levels(cm.sum(axis=1)), label_levels(cm.sum(axis=0)))
+        t = bench(fn, args.repeat)
+        print(f"{size:>10} {'psnr':>12} {t_ref:>10.5f} {1.0:>8.1f} {0.0:>10.2e}")
+        print(f"{size:>10} {'psnr_cm':>12} {t:>10.5f} {t_ref / t:>8.1f} {abs(fn() - ref):>10.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from __future__ import annotations
+import argparse, sys, time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.fuzzy_entropy import (fuzzy_entropy_objective, fuzzy_entropy_batch, fuzzy_entropy_banded, evaluate_population,
+                               sorted_thresholds_batch, IncrementalFuzzyEntropy)
+
+def bench(fn, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--Ks", default="2,3,5")
+    ap.add_argument("--pop", type=int, default=30)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--tol", type=float, default=1e-6, help="tolerance of fuzzy_entropy_banded (bench-only reference)")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    hist = rng.random(256); hist /= hist.sum()
+    print(f"{'K':>3} {'mode':>10} {'sec/pop':>12} {'speedup':>8} {'max|err|':>10}")
+    for K in [int(k) for k in args.Ks.split(",") if k.strip()]:
+        obj = fuzzy_entropy_objective(hist, K=K)
+        X = rng.uniform(1, 254, size=(args.pop, K))
+        t_loop = bench(lambda: [obj(x) for x in X], args.repeat)
+        # float thresholds bypass the membership tables -> per-call sigmoid math
+        Tf = sorted_thresholds_batch(X, K).astype(np.float64)
+        t_exp = bench(lambda: fuzzy_entropy_batch(hist, Tf), args.repeat)
+        t_batch = bench(lambda: evaluate_population(obj, X), args.repeat)
+        banded = lambda X: fuzzy_entropy_banded(hist, sorted_thresholds_batch(X, K), tol=args.tol)
+        t_band = bench(lambda: banded(X), args.repeat)
+        # agreement of the banded reference with the dense objective on many random candidates
+        Xa = rng.uniform(1, 254, size=(2000, K))
+        err = np.abs(evaluate_population(obj, Xa) - banded(Xa)).max()
+        # mỗi ngưỡng góp tối đa cỡ tol sai số ở hai mép dải
+        assert err <= K * args.tol, f"banded mode differs from dense by {err:.3e} at K={K} (tol={args.tol})"
+        print(f"{K:>3} {'loop':>10} {t_loop:>12.6f} {1.0:>8.1f}")
+        print(f"{K:>3} {'batch-exp':>10} {t_exp:>12.6f} {t_loop / t_exp:>8.1f}")
+        print(f"{K:>3} {'batch':>10} {t_batch:>12.6f} {t_loop / t_batch:>8.1f}")
+        print(f"{K:>3} {'banded':>10} {t_band:>12.6f} {t_loop / t_band:>8.1f} {err:>10.2e}")
+        # pop single-threshold moves re-scored incrementally
+        inc = IncrementalFuzzyEntropy(hist, K)
+        moves = [(j, int(inc.T[j]) + d) for j in range(K) for d in (-1, 1)]
+        moves = [moves[i % len(moves)] for i in range(args.pop)]
+        t_inc = bench(lambda: [inc.peek(j, t) for j, t in moves], args.repeat)
+        err = max(abs(inc.peek(j, t) - obj(np.where(np.arange(K) == j, t, inc.T))) for j, t in moves)
+        assert err <= 1e-9, f"incremental moves differ from dense by {err:.3e} at K={K}"
+        print(f"{K:>3} {'incr-move':>10} {t_inc:>12.6f} {t_loop / t_inc:>8.1f} {err:>10.2e}")
+
+    print("banded/incremental results agree with dense within tolerance")
+
+if __name__ == "__main__":
+    main()
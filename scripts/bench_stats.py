@@ -0,0 +1,75 @@
+from __future__ import annotations
+import argparse, sys, time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.results_store import Pivot
+from src.stats import compare_to, rank_tests
+import scipy.stats  # noqa: F401  (nạp trước để không tính thời gian import)
+
+def synth(rng, n_img, algos, Ks, runs):
+    """Columns like results_store.iter_chunks yields, one row per (image, algo, K, run)."""
+    I, A, K, R = np.meshgrid(np.arange(n_img), np.arange(len(algos)), Ks, np.arange(runs), indexing="ij")
+    I, A, K, R = (v.ravel() for v in (I, A, K, R))
+    base = rng.random(n_img)[I] * 0.5 + 0.02 * A
+    cols = {"image": np.array([f"img{i:05d}.tif" for i in I]), "algo": np.array(algos)[A],
+            "K": K.astype(np.int16), "run": R.astype(np.int32)}
+    for j, m in enumerate(("Dice", "IoU", "FE")):
+        cols[m] = np.round(base + 0.05 * rng.standard_normal(len(I)) + j, 3)
+    return cols
+
+def old_sigtest(cols, algos, Ks):
+    # cách cũ: dict theo ảnh rồi quét lại toàn bộ dict cho mỗi (K, metric, baseline)
+    from scipy.stats import wilcoxon
+    acc = {}
+    for r in range(len(cols["algo"])):
+        key = (cols["image"][r], int(cols["K"][r]))
+        d = acc.setdefault(key, {}).setdefault(cols["algo"][r], [[], [], []])
+        for j, m in enumerate(("Dice", "IoU", "FE")):
+            d[j].append(cols[m][r])
+    per_img = {k: {a: tuple(float(np.mean(v)) for v in d) for a, d in dd.items()} for k, dd in acc.items()}
+    rows = []
+    for K in Ks:
+        for met_idx, met in enumerate(["dice", "iou", "fe"]):
+            for base in algos[1:]:
+                X, Y = [], []
+                for (ip, k), d in per_img.items():
+                    if k == K and "mfwoa" in d and base in d:
+                        X.append(d["mfwoa"][met_idx]); Y.append(d[base][met_idx])
+                if len(X) >= 5:
+                    W, p = wilcoxon(X, Y, zero_method="wilcox", alternative="greater")
+                    rows.append([met, K, base, len(X), float(W), float(p)])
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=300)
+    ap.add_argument("--algos", default="mfwoa,woa,pso,ga,otsu")
+    ap.add_argument("--Ks", default="2,3,4,5")
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--boot", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    algos = args.algos.split(","); Ks = [int(k) for k in args.Ks.split(",")]
+    cols = synth(np.random.default_rng(args.seed), args.images, algos, Ks, args.runs)
+    print(f"{len(cols['algo'])} rows: {args.images} images x {len(algos)} algos x {len(Ks)} K x {args.runs} runs")
+
+    t0 = time.perf_counter(); old = old_sigtest(cols, algos, Ks); t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    pv = Pivot().update(cols)
+    new = compare_to(pv, "mfwoa", baselines=algos, n_boot=args.boot, seed=args.seed)
+    t_new = time.perf_counter() - t0
+    t0 = time.perf_counter(); ranks = rank_tests(pv, algos); t_rank = time.perf_counter() - t0
+
+    a = {tuple(r[:3]): r[3:6] for r in old}
+    b = {tuple(r[:3]): r[3:6] for r in new}
+    diff = max(abs(a[k][2] - b[k][2]) for k in a) if a.keys() == b.keys() else np.nan
+    print(f"old per_img scan + scipy wilcoxon: {t_old:.3f}s ({len(old)} tests)")
+    print(f"pivot + wilcoxon/sign/bootstrap:   {t_new:.3f}s ({len(new)} tests, {args.boot} resamples)  speedup {t_old / t_new:.1f}x")
+    print(f"friedman/nemenyi:                  {t_rank:.3f}s ({len(ranks)} rows)")
+    print(f"max |p_old - p_new| = {diff:.2e}")
+
+if __name__ == "__main__":
+    main()
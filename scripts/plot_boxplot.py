@@ -1,22 +1,33 @@
-
 from __future__ import annotations
-import argparse, csv
+import argparse, sys
 from pathlib import Path
+import numpy as np
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.results_store import iter_chunks
+
+COLUMN = {"dice": "Dice", "iou": "IoU", "acc": "Acc", "time": "sec", "fe": "FE", "psnr": "PSNR", "ssim": "SSIM"}
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--csv", required=True)
-    ap.add_argument("--metric", default="dice", choices=["dice","iou","acc","time"])
+    ap.add_argument("--csv", default=None, help="metrics_*.csv (or use --store)")
+    ap.add_argument("--store", default=None, help="results_* directory written with --store")
+    ap.add_argument("--metric", default="dice", choices=list(COLUMN))
     ap.add_argument("--out", default="results/boxplot.png")
     args = ap.parse_args()
+    if (args.csv is None) == (args.store is None):
+        ap.error("give exactly one of --csv / --store")
 
-    rows = [r for r in csv.DictReader(open(args.csv, encoding="utf-8"))]
+    col = COLUMN[args.metric]
     by_algo = {}
-    for r in rows:
-        by_algo.setdefault(r["algo"], []).append(float(r[args.metric]))
+    for chunk in iter_chunks(args.store or args.csv, columns=["algo", col]):
+        x = chunk[col]
+        ok = ~np.isnan(x)
+        for algo in np.unique(chunk["algo"]):
+            by_algo.setdefault(str(algo), []).append(x[ok & (chunk["algo"] == algo)])
     labels = sorted(by_algo.keys())
-    data = [by_algo[k] for k in labels]
+    data = [np.concatenate(by_algo[k]) for k in labels]
     plt.figure()
     plt.boxplot(data)
     plt.xticks(range(1, len(labels)+1), labels, rotation=0)
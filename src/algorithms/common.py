@@ -0,0 +1,115 @@
+
+import time
+import numpy as np
+from ..fuzzy_entropy import evaluate_population
+
+class Budget:
+    """Stopping criteria shared by the optimizers.
+
+    max_evals: objective evaluations (one per candidate vector); time_limit: wall-clock seconds
+    from construction; patience: stop after this many iterations whose best improved by no more
+    than min_delta. After a run, evals/iters say what was used and reason why it stopped
+    ("max_evals", "time", "stagnation" or "iters" when the iteration count ran out).
+    """
+    def __init__(self, max_evals=None, time_limit=None, patience=None, min_delta=0.0):
+        self.max_evals = max_evals
+        self.time_limit = time_limit
+        self.patience = patience
+        self.min_delta = min_delta
+        self.evals = 0
+        self.iters = 0
+        self.reason = None
+        self._t0 = time.perf_counter()
+        self._best = -np.inf
+        self._stall = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self._t0
+
+    def done(self):
+        if self.reason is None:
+            if self.max_evals is not None and self.evals >= self.max_evals:
+                self.reason = "max_evals"
+            elif self.time_limit is not None and self.elapsed() >= self.time_limit:
+                self.reason = "time"
+        return self.reason is not None
+
+    def evaluate(self, obj, X):
+        """evaluate_population within the eval budget; rows past it score -inf."""
+        n = len(X)
+        m = n if self.max_evals is None else min(n, max(0, self.max_evals - self.evals))
+        self.evals += m
+        if m == n:
+            return evaluate_population(obj, X)
+        fit = np.full(n, -np.inf)
+        if m > 0:
+            fit[:m] = evaluate_population(obj, X[:m])
+        return fit
+
+    def allows(self):
+        """True while max_evals and time_limit are not reached (ignores why the optimizer stopped)."""
+        return ((self.max_evals is None or self.evals < self.max_evals)
+                and (self.time_limit is None or self.elapsed() < self.time_limit))
+
+    def spend(self, n=1):
+        """Count n evaluations made outside evaluate/call (e.g. incremental local-search moves)."""
+        self.evals += n
+
+    def call(self, obj, x):
+        self.evals += 1
+        return obj(x)
+
+    def step(self, best_fit):
+        """Close one iteration with the current best fitness; True when the run should stop."""
+        self.iters += 1
+        if self.patience is not None:
+            if best_fit > self._best + self.min_delta:
+                self._best = best_fit
+                self._stall = 0
+            else:
+                self._stall += 1
+                if self._stall >= self.patience and self.reason is None:
+                    self.reason = "stagnation"
+        return self.done()
+
+    def finish(self):
+        if self.reason is None:
+            self.reason = "iters"
+        return self
+
+def fit_thresholds(T, K, bounds=(1, 254)):
+    """Sorted K-threshold version of T: evenly chosen subset if longer, widest gaps split if shorter."""
+    lb, ub = bounds
+    T = np.sort(np.clip(np.asarray(T, dtype=np.float64).ravel(), lb, ub))
+    if len(T) > K:
+        return T[np.round(np.linspace(0, len(T) - 1, K)).astype(int)]
+    T = list(T)
+    while len(T) < K:
+        edges = [lb] + T + [ub]
+        j = int(np.argmax(np.diff(edges)))
+        T.insert(j, 0.5 * (edges[j] + edges[j + 1]))
+    return np.asarray(T)
+
+def seed_population(rng, X, bounds, seeds=None, frac=1.0, spread=0.02):
+    """Replace the first round(frac*len(X)) rows of X (in place) by seed threshold vectors.
+
+    Each seed is used once as is; further seeded rows are copies jittered by spread*(ub-lb).
+    """
+    if seeds is None or len(seeds) == 0 or frac <= 0 or len(X) == 0:
+        return X
+    lb, ub = bounds
+    S = np.array([fit_thresholds(s, X.shape[1], bounds) for s in seeds])
+    n = min(len(X), max(len(S), int(round(frac * len(X)))))
+    rows = S[np.arange(n) % len(S)]
+    rows[len(S):] += rng.normal(0, spread * (ub - lb), size=rows[len(S):].shape)
+    X[:n] = np.clip(rows, lb, ub)
+    return X
+
+def init_population(rng, pop, dim, bounds, seeds=None, frac=1.0):
+    """Uniform random population, optionally warm-started from seeds (see seed_population).
+
+    The uniform draw comes first, so without seeds the RNG stream is the same as before.
+    """
+    lb, ub = bounds
+    X = rng.uniform(lb, ub, size=(pop, dim))
+    return seed_population(rng, X, bounds, seeds, frac)
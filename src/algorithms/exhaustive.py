@@ -0,0 +1,102 @@
+
+import itertools
+import numpy as np
+from ..fuzzy_entropy import membership_tables, sorted_thresholds, fuzzy_entropy_batch, _xlogx
+from .local_search import local_search
+
+# Per-bin entropy is written with D = sum(mu) and G = sum(mu*log(mu)) over the unnormalized
+# memberships: -sum(q*log(q)) = (-G + D*log(D)) / D with q = mu / D.
+
+def _bin_entropy(D, G):
+    Dp = D + 1e-12
+    return (-G + D * np.log(Dp)) / Dp
+
+def _rescored(hist, T, s):
+    # report the dense objective value the optimizers are scored with
+    T = np.asarray(T, dtype=np.int32)
+    return T, float(fuzzy_entropy_batch(hist, T[None], s=s)[0])
+
+def exhaustive_optimize(hist, K, s=2.0, bounds=(1, 254), max_k=3, chunk=1 << 22):
+    """Global optimum of the fuzzy entropy by enumerating every threshold combination."""
+    if K > max_k:
+        raise ValueError("exhaustive search is limited to K<=%d (got K=%d); use 'dp'" % (max_k, K))
+    hist = np.asarray(hist, dtype=np.float64)
+    A, B = membership_tables(float(s))
+    LA, LB = _xlogx(A), _xlogx(B)
+    lb, ub = bounds
+    best_fit, best_T = -np.inf, None
+
+    # The last threshold u is vectorized; for K>=2 the one before it (v) is looped over and
+    # the remaining prefixes t_0..t_{K-3} < v are stacked in chunks.
+    if K == 1:
+        u = np.arange(lb, ub + 1)
+        fit = _bin_entropy(A[u] + B[u], LA[u] + LB[u]) @ hist
+        return _rescored(hist, u[int(np.argmax(fit))][None], s)
+
+    for v in range(lb + K - 2, ub):
+        u = np.arange(v + 1, ub + 1)
+        prefixes = np.array(list(itertools.combinations(range(lb, v), K - 2)), dtype=np.int64)
+        step = max(1, chunk // (len(u) * 256))
+        for c in range(0, len(prefixes), step):
+            Pm = prefixes[c:c+step]
+            T = np.concatenate([Pm, np.full((len(Pm), 1), v)], axis=1)
+            mu = np.concatenate([A[T[:, :1]], B[T[:, :-1]] * A[T[:, 1:]]], axis=1)
+            Dp = mu.sum(axis=1)[:, None]
+            Gp = _xlogx(mu).sum(axis=1)[:, None]
+            # class K-1 = B[v]*A[u], class K = B[u]
+            D = Dp + B[v] * A[u] + B[u]
+            G = Gp + LB[v] * A[u] + B[v] * LA[u] + LB[u]
+            fit = _bin_entropy(D, G) @ hist
+            i, j = np.unravel_index(int(np.argmax(fit)), fit.shape)
+            if fit[i, j] > best_fit:
+                best_fit = float(fit[i, j])
+                best_T = np.append(T[i], u[j])
+    return _rescored(hist, best_T, s)
+
+def dp_optimize(hist, K, s=2.0, bounds=(1, 254), polish=1000):
+    """Approximate thresholds: dynamic programming on a surrogate, then local search.
+
+    Dropping the membership normalization (sum(mu) is 1 only up to the overlap of adjacent
+    sigmoids) splits the entropy into terms of (t_{j-1}, t_j) pairs, and the DP maximizes
+    that surrogate in O(K*256^2). Its optimum is not the FE optimum, so it is polished on
+    the true objective; the result is a good heuristic, not a guaranteed optimum.
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    A, B = membership_tables(float(s))
+    LA, LB = _xlogx(A), _xlogx(B)
+    lb, ub = bounds
+    # -hist . xlogx(B[u]*A[v]) = -hist . (LB[u]*A[v] + B[u]*LA[v])
+    C = -((LB * hist) @ A.T + (B * hist) @ LA.T)
+    first = -(LA @ hist)
+    last = -(LB @ hist)
+    invalid = np.tril(np.ones((256, 256), dtype=bool))      # u >= v
+    invalid[:lb] = invalid[:, :lb] = True
+    invalid[ub+1:] = invalid[:, ub+1:] = True
+    C[invalid] = -np.inf
+
+    F = first.copy()
+    F[:lb] = F[ub+1:] = -np.inf
+    back = []
+    for _ in range(K - 1):
+        M = F[:, None] + C
+        arg = np.argmax(M, axis=0)
+        back.append(arg)
+        F = M[arg, np.arange(256)]
+    t = int(np.argmax(F + last))
+    T = [t]
+    for arg in reversed(back):
+        t = int(arg[t])
+        T.append(t)
+    T = sorted_thresholds(np.array(T[::-1], dtype=np.float64), K)
+    T, _ = local_search(hist, K, T, s=s, steps=(1,), max_moves=polish)
+    return _rescored(hist, T, s)
+
+def reference_optimum(hist, K, s=2.0, max_k=3):
+    """Exact FE optimum (T, FE) for (hist, K) by exhaustive search, None when K>max_k.
+
+    dp_optimize drops the membership normalization, so its result is only a heuristic and
+    can be beaten by the metaheuristics; it is never returned as a reference.
+    """
+    if K <= max_k:
+        return exhaustive_optimize(hist, K, s=s, max_k=max_k)
+    return None
@@ -1,13 +1,20 @@
 
 import numpy as np
-from ..fuzzy_entropy import sorted_thresholds
+from ..fuzzy_entropy import sorted_thresholds, evaluate_population
+from .common import init_population
 
-def ga_optimize(obj, K, bounds=(1,254), pop=30, iters=100, pc=0.9, pm=0.1, seed=42):
+def ga_optimize(obj, K, bounds=(1,254), pop=30, iters=100, pc=0.9, pm=0.1, seed=42, vectorized=False, elitism=0, budget=None,
+                seeds=None, init_frac=1.0):
     rng = np.random.default_rng(seed)
     lb, ub = bounds
     dim = K
-    X = rng.uniform(lb, ub, size=(pop, dim))
-    fitness = np.array([obj(x) for x in X], dtype=np.float64)
+    X = init_population(rng, pop, dim, bounds, seeds, init_frac)
+    evaluate = budget.evaluate if budget is not None else evaluate_population
+    fitness = evaluate(obj, X)
+    best_idx = int(np.argmax(fitness))
+    best, best_fit = X[best_idx].copy(), float(fitness[best_idx])
+    n_elite = min(int(elitism), pop)
+    alpha = 0.3
 
     def select_parent():
         i = rng.integers(0, pop)
@@ -15,24 +22,57 @@ def ga_optimize(obj, K, bounds=(1,254), pop=30, iters=100, pc=0.9, pm=0.1, seed=
         return X[i] if fitness[i] > fitness[j] else X[j]
 
     for it in range(iters):
-        new_pop = []
-        while len(new_pop) < pop:
-            if rng.random() < pc:
-                p1 = select_parent().copy()
-                p2 = select_parent().copy()
-                alpha = 0.3
-                low = np.minimum(p1, p2) - alpha * np.abs(p1 - p2)
-                high = np.maximum(p1, p2) + alpha * np.abs(p1 - p2)
-                c1 = rng.uniform(low, high)
-                c2 = rng.uniform(low, high)
-                new_pop.extend([c1, c2])
-            else:
-                new_pop.append(select_parent().copy())
-        X = np.array(new_pop[:pop])
+        if budget is not None and budget.done():
+            break
+        X_prev, fit_prev = X, fitness
+        elite_idx = np.argsort(fitness)[pop-n_elite:]
+        elite_X, elite_fit = X[elite_idx].copy(), fitness[elite_idx].copy()
+        if vectorized:
+            # Whole-generation step: binary tournaments for both parents of every pair,
+            # BLX-alpha where a pair crosses over, copies of the parents otherwise
+            n_pairs = (pop + 1) // 2
+            a, b = rng.integers(0, pop, size=(2, n_pairs, 2))
+            winner = np.where(fitness[a] > fitness[b], a, b)
+            p1, p2 = X[winner[:, 0]], X[winner[:, 1]]
+            low = np.minimum(p1, p2) - alpha * np.abs(p1 - p2)
+            high = np.maximum(p1, p2) + alpha * np.abs(p1 - p2)
+            c1 = rng.uniform(low, high)
+            c2 = rng.uniform(low, high)
+            cross = (rng.random(n_pairs) < pc)[:, None]
+            X = np.stack([np.where(cross, c1, p1), np.where(cross, c2, p2)], axis=1).reshape(-1, dim)[:pop]
+        else:
+            new_pop = []
+            while len(new_pop) < pop:
+                if rng.random() < pc:
+                    p1 = select_parent().copy()
+                    p2 = select_parent().copy()
+                    low = np.minimum(p1, p2) - alpha * np.abs(p1 - p2)
+                    high = np.maximum(p1, p2) + alpha * np.abs(p1 - p2)
+                    c1 = rng.uniform(low, high)
+                    c2 = rng.uniform(low, high)
+                    new_pop.extend([c1, c2])
+                else:
+                    new_pop.append(select_parent().copy())
+            X = np.array(new_pop[:pop])
         mut_mask = rng.random(X.shape) < pm
         X[mut_mask] += rng.normal(0, (ub-lb)*0.05, size=mut_mask.sum())
         X = np.clip(X, lb, ub)
-        fitness = np.array([obj(x) for x in X], dtype=np.float64)
+        if n_elite > 0:
+            # the best individuals survive unchanged and keep their known fitness
+            X[:n_elite] = elite_X
+            fitness = np.concatenate([elite_fit, evaluate(obj, X[n_elite:])])
+        else:
+            fitness = evaluate(obj, X)
+        # hàng vượt ngân sách đánh giá (-inf) giữ cá thể cũ thay vì một con chưa được chấm điểm
+        cut = np.isneginf(fitness)
+        if cut.any():
+            X[cut], fitness[cut] = X_prev[cut], fit_prev[cut]
+        i = int(np.argmax(fitness))
+        if fitness[i] > best_fit:
+            best, best_fit = X[i].copy(), float(fitness[i])
+        if budget is not None:
+            budget.step(best_fit)
 
-    best_idx = int(np.argmax(fitness))
-    return sorted_thresholds(X[best_idx], K), float(fitness[best_idx])
+    if budget is not None:
+        budget.finish()
+    return sorted_thresholds(best, K), best_fit
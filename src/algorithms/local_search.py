@@ -0,0 +1,29 @@
+
+from ..fuzzy_entropy import IncrementalFuzzyEntropy
+
+def local_search(hist, K, x, s=2.0, steps=(8, 4, 2, 1), max_moves=1000, budget=None):
+    """Hill-climb one threshold at a time (+-step moves) from x, scoring moves incrementally.
+
+    At most max_moves accepted moves in total. budget: optional Budget; every scored move counts
+    as one evaluation and the search stops once its max_evals or time_limit is reached.
+    """
+    inc = IncrementalFuzzyEntropy(hist, K, s=s, x=x)
+    moves = 0
+    for step in steps:
+        improved = True
+        while improved and moves < max_moves:
+            improved = False
+            for j in range(K):
+                for d in (-step, step):
+                    if moves >= max_moves or (budget is not None and not budget.allows()):
+                        improved = False
+                        break
+                    t = int(inc.T[j]) + d
+                    if not inc.can_move(j, t):
+                        continue
+                    if budget is not None:
+                        budget.spend()
+                    if inc.try_move(j, t):
+                        moves += 1
+                        improved = True
+    return inc.T.copy(), inc.score
@@ -1,15 +1,30 @@
 
 import numpy as np
-from ..fuzzy_entropy import sorted_thresholds
+from ..fuzzy_entropy import sorted_thresholds, evaluate_population
+from .common import seed_population
 
-def mfwoa_optimize(task_objs, Ks, bounds=(1,254), pop=40, iters=100, rmp=0.3, seed=42):
+def mfwoa_optimize(task_objs, Ks, bounds=(1,254), pop=40, iters=100, rmp=0.3, seed=42, vectorized=False, budget=None,
+                   seeds=None, init_frac=1.0):
+    """seeds: optional list (one entry per task) of seed threshold vectors for that task's whales."""
     rng = np.random.default_rng(seed)
     maxK = max(Ks)
     lb, ub = bounds
     n_tasks = len(Ks)
 
     skill = rng.integers(0, n_tasks, size=pop)
+    # every task keeps at least one whale (taken from the largest task)
+    counts = np.bincount(skill, minlength=n_tasks)
+    for t in np.flatnonzero(counts == 0):
+        donor = int(np.argmax(counts))
+        if counts[donor] < 2:
+            break
+        skill[np.flatnonzero(skill == donor)[0]] = t
+        counts[donor] -= 1; counts[t] += 1
     X = rng.uniform(lb, ub, size=(pop, maxK))
+    if seeds is not None:
+        for t, task_seeds in enumerate(seeds):
+            idx = np.flatnonzero(skill == t)
+            X[idx, :Ks[t]] = seed_population(rng, X[idx, :Ks[t]], bounds, task_seeds, init_frac)
     fitness = np.full(pop, -np.inf, dtype=np.float64)
     best_per_task = [None]*n_tasks
     bestfit_per_task = [-np.inf]*n_tasks
@@ -18,19 +33,76 @@ def mfwoa_optimize(task_objs, Ks, bounds=(1,254), pop=40, iters=100, rmp=0.3, se
         t = skill[i]
         K = Ks[t]
         f = task_objs[t]
-        fit = f(X[i][:K])
+        fit = budget.call(f, X[i][:K]) if budget is not None else f(X[i][:K])
         return fit
 
-    for i in range(pop):
-        fitness[i] = eval_i(i)
-        t = skill[i]
-        if fitness[i] > bestfit_per_task[t]:
-            bestfit_per_task[t] = fitness[i]
-            best_per_task[t] = X[i].copy()
+    evaluate = budget.evaluate if budget is not None else evaluate_population
+
+    for t in range(n_tasks):
+        idx = np.flatnonzero(skill == t)
+        if len(idx) == 0:
+            continue
+        fitness[idx] = evaluate(task_objs[t], X[idx, :Ks[t]])
+        i = idx[int(np.argmax(fitness[idx]))]
+        bestfit_per_task[t] = fitness[i]
+        best_per_task[t] = X[i].copy()
+
+    Ks_arr = np.asarray(Ks)
+    dmask = np.arange(maxK) < Ks_arr[skill][:, None]   # active dims of each whale
 
     for it in range(iters):
+        if budget is not None and budget.done():
+            break
         a = 2.0 - 2.0 * (it / max(1, iters-1))
+        if vectorized:
+            # Synchronous step: all whales move w.r.t. the same X and task bests, evaluated per task in batches
+            best_mat = np.array([X_b if X_b is not None else np.full(maxK, np.nan) for X_b in best_per_task])
+            A = 2.0 * a * rng.random((pop, maxK)) - a
+            C = 2.0 * rng.random((pop, maxK))
+            guide_task = skill.copy()
+            if n_tasks > 1:
+                transfer = rng.random(pop) < rmp
+                other = rng.integers(0, n_tasks - 1, size=pop)
+                other += other >= skill
+                transfer &= ~np.isnan(best_mat[other, 0])
+                guide_task[transfer] = other[transfer]
+            guide = best_mat[guide_task]
+            no_best = np.isnan(guide[:, 0])
+            guide[no_best] = X[no_best]
+            p = rng.random(pop)
+            rand_idx = rng.integers(0, pop, size=pop)
+            l = (rng.random((pop, maxK)) * 2.0) - 1.0
+
+            explore = np.linalg.norm(A * dmask, ord=2, axis=1) >= 1
+            ref = np.where(explore[:, None], X[rand_idx], guide)
+            enc = ref - A * np.abs(C * ref - X)
+            b = 1.0
+            spiral = np.abs(guide - X) * np.exp(b * l) * np.cos(2*np.pi*l) + guide
+            X_new = np.where(dmask, np.clip(np.where((p < 0.5)[:, None], enc, spiral), lb, ub), X)
+
+            fit_new = np.empty(pop, dtype=np.float64)
+            for t in range(n_tasks):
+                idx = np.flatnonzero(skill == t)
+                if len(idx) > 0:
+                    fit_new[idx] = evaluate(task_objs[t], X_new[idx, :Ks[t]])
+            accept = fit_new >= fitness
+            X[accept] = X_new[accept]
+            fitness[accept] = fit_new[accept]
+            for t in range(n_tasks):
+                idx = np.flatnonzero(skill == t)
+                if len(idx) == 0:
+                    continue
+                i = idx[int(np.argmax(fitness[idx]))]
+                if fitness[i] > bestfit_per_task[t]:
+                    bestfit_per_task[t] = fitness[i]
+                    best_per_task[t] = X[i].copy()
+            if budget is not None:
+                # stagnation is judged on the sum of the task bests
+                budget.step(float(np.sum(bestfit_per_task)))
+            continue
         for i in range(pop):
+            if budget is not None and budget.done():
+                break
             t = skill[i]
             K = Ks[t]
             best_t = best_per_task[t] if best_per_task[t] is not None else X[i]
@@ -74,7 +146,11 @@ def mfwoa_optimize(task_objs, Ks, bounds=(1,254), pop=40, iters=100, rmp=0.3, se
                 if fit_new > bestfit_per_task[t]:
                     bestfit_per_task[t] = fit_new
                     best_per_task[t] = X[i].copy()
+        if budget is not None:
+            budget.step(float(np.sum(bestfit_per_task)))
 
+    if budget is not None:
+        budget.finish()
     out_T, out_fit = [], []
     for ti, K in enumerate(Ks):
         if best_per_task[ti] is None:
@@ -1,45 +1,49 @@
 
 import numpy as np
+from functools import lru_cache
 
-def _otsu_2class(hist):
-    p = hist / (hist.sum() + 1e-12)
-    omega = np.cumsum(p)
-    mu = np.cumsum(p * np.arange(len(p)))
-    mu_t = mu[-1]
-    sigma_b2 = (mu_t*omega - mu)**2 / (omega*(1.0 - omega) + 1e-12)
-    sigma_b2[omega*(1.0 - omega) < 1e-8] = 0.0
-    t = int(np.argmax(sigma_b2))
-    return t
+@lru_cache(maxsize=4)
+def _lower(n):
+    return np.tri(n, k=-1, dtype=bool)
 
 def multi_otsu_thresholds(hist, classes=3):
+    """Exact multi-level Otsu straight from a 256-bin histogram (counts or probabilities).
+
+    Maximizes the between-class variance sum(m_c^2 / w_c) by dynamic programming over
+    cumulative moments in O(classes * 256^2). Thresholds are the last bin of each class,
+    as returned by skimage's threshold_multiotsu.
+    """
     if classes <= 1:
         return np.array([], dtype=np.int32)
-    try:
-        from skimage.filters import threshold_multiotsu
-        thresholds = threshold_multiotsu(np.arange(256, dtype=np.uint8).repeat(hist.astype(int)), classes=classes)
-        return thresholds.astype(np.int32)
-    except Exception:
-        regions = [(0, 255)]
-        thresholds = []
-        for _ in range(classes - 1):
-            best_gain = -np.inf
-            best_t = None
-            best_region_idx = None
-            for idx, (lo, hi) in enumerate(regions):
-                h = hist[lo:hi+1].astype(np.float64)
-                if h.sum() < 1e-9 or hi - lo < 2:
-                    continue
-                t_rel = _otsu_2class(h)
-                t = lo + t_rel
-                gain = h[:t_rel+1].sum() * h[t_rel+1:].sum()
-                if gain > best_gain:
-                    best_gain = gain
-                    best_t = t
-                    best_region_idx = idx
-            if best_t is None:
-                break
-            thresholds.append(best_t)
-            lo, hi = regions.pop(best_region_idx)
-            regions.extend([(lo, best_t), (best_t+1, hi)])
-            regions.sort(key=lambda x: x[0])
-        return np.array(sorted(thresholds), dtype=np.int32)
+    p = np.asarray(hist, dtype=np.float64)
+    p = p / (p.sum() + 1e-12)
+    nz = np.flatnonzero(p)
+    if len(nz) <= classes:
+        return nz[:-1].astype(np.int32)
+
+    n = len(p)
+    P = np.concatenate([[0.0], np.cumsum(p)])
+    S = np.concatenate([[0.0], np.cumsum(p * np.arange(n))])
+    # cost[a, b]: m^2/w of a class spanning bins a..b
+    w = P[None, 1:] - P[:-1, None]
+    m = S[None, 1:] - S[:-1, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost = m * m / w
+    cost[w <= 0] = 0.0
+    cost[_lower(n)] = -np.inf
+    # like skimage, the first class always reaches past the lowest occupied bin
+    cost[0, :nz[0] + 1] = -np.inf
+
+    F = cost[0].copy()          # best score of the classes so far, last one ending at bin b
+    back = []
+    for _ in range(classes - 1):
+        M = F[:-1, None] + cost[1:]          # previous classes end at j, next spans j+1..b
+        arg = np.argmax(M, axis=0)
+        back.append(arg)
+        F = M[arg, np.arange(n)]
+    b = n - 1
+    thresholds = []
+    for arg in reversed(back):
+        b = int(arg[b])
+        thresholds.append(b)
+    return np.array(thresholds[::-1], dtype=np.int32)
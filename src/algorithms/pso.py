@@ -1,26 +1,31 @@
 
 import numpy as np
-from ..fuzzy_entropy import sorted_thresholds
+from ..fuzzy_entropy import sorted_thresholds, evaluate_population
+from .common import init_population
 
-def pso_optimize(obj, K, bounds=(1,254), pop=20, iters=100, w=0.72, c1=1.49, c2=1.49, seed=42):
+def pso_optimize(obj, K, bounds=(1,254), pop=20, iters=100, w=0.72, c1=1.49, c2=1.49, seed=42, budget=None,
+                 seeds=None, init_frac=1.0):
     rng = np.random.default_rng(seed)
     lb, ub = bounds
     dim = K
-    X = rng.uniform(lb, ub, size=(pop, dim))
+    X = init_population(rng, pop, dim, bounds, seeds, init_frac)
     V = rng.normal(0, (ub-lb)*0.1, size=(pop, dim))
     pbest = X.copy()
-    pbest_fit = np.array([obj(x) for x in X], dtype=np.float64)
+    evaluate = budget.evaluate if budget is not None else evaluate_population
+    pbest_fit = evaluate(obj, X)
 
     g_idx = int(np.argmax(pbest_fit))
     gbest = pbest[g_idx].copy()
     gbest_fit = float(pbest_fit[g_idx])
 
     for it in range(iters):
+        if budget is not None and budget.done():
+            break
         r1 = rng.random((pop, dim))
         r2 = rng.random((pop, dim))
         V = w*V + c1*r1*(pbest - X) + c2*r2*(gbest - X)
         X = np.clip(X + V, lb, ub)
-        fit = np.array([obj(x) for x in X], dtype=np.float64)
+        fit = evaluate(obj, X)
         better = fit > pbest_fit
         pbest[better] = X[better]
         pbest_fit[better] = fit[better]
@@ -28,5 +33,9 @@ def pso_optimize(obj, K, bounds=(1,254), pop=20, iters=100, w=0.72, c1=1.49, c2=
             g_idx = int(np.argmax(fit))
             gbest = X[g_idx].copy()
             gbest_fit = float(fit[g_idx])
+        if budget is not None:
+            budget.step(gbest_fit)
 
+    if budget is not None:
+        budget.finish()
     return sorted_thresholds(gbest, K), gbest_fit
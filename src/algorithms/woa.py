@@ -1,20 +1,51 @@
 
 import numpy as np
-from ..fuzzy_entropy import sorted_thresholds
+from ..fuzzy_entropy import sorted_thresholds, evaluate_population
+from .common import init_population
 
-def woa_optimize(obj, K, bounds=(1,254), pop=20, iters=100, seed=42):
+def woa_optimize(obj, K, bounds=(1,254), pop=20, iters=100, seed=42, vectorized=False, budget=None,
+                 seeds=None, init_frac=1.0):
     rng = np.random.default_rng(seed)
     dim = K
     lb, ub = bounds
-    X = rng.uniform(lb, ub, size=(pop, dim))
-    fitness = np.array([obj(x) for x in X], dtype=np.float64)
+    X = init_population(rng, pop, dim, bounds, seeds, init_frac)
+    evaluate = budget.evaluate if budget is not None else evaluate_population
+    fitness = evaluate(obj, X)
     best_idx = int(np.argmax(fitness))
     best = X[best_idx].copy()
     best_fit = float(fitness[best_idx])
 
     for t in range(iters):
+        if budget is not None and budget.done():
+            break
         a = 2.0 - 2.0 * (t / max(1, iters-1))
+        if vectorized:
+            # Synchronous step: every whale moves w.r.t. the same X and best, then one batch evaluation
+            A = 2.0 * a * rng.random((pop, dim)) - a
+            C = 2.0 * rng.random((pop, dim))
+            p = rng.random(pop)
+            rand_idx = rng.integers(0, pop, size=pop)
+            l = (rng.random((pop, dim)) * 2.0) - 1.0
+            explore = np.linalg.norm(A, ord=2, axis=1) >= 1
+            ref = np.where(explore[:, None], X[rand_idx], best)
+            X_enc = ref - A * np.abs(C * ref - X)
+            b = 1.0
+            X_spiral = np.abs(best - X) * np.exp(b * l) * np.cos(2*np.pi*l) + best
+            X_new = np.clip(np.where((p < 0.5)[:, None], X_enc, X_spiral), lb, ub)
+            fit_new = evaluate(obj, X_new)
+            improved = fit_new > fitness
+            X[improved] = X_new[improved]
+            fitness[improved] = fit_new[improved]
+            i = int(np.argmax(fitness))
+            if fitness[i] > best_fit:
+                best_fit = float(fitness[i])
+                best = X[i].copy()
+            if budget is not None:
+                budget.step(best_fit)
+            continue
         for i in range(pop):
+            if budget is not None and budget.done():
+                break
             r1 = rng.random(dim)
             r2 = rng.random(dim)
             A = 2.0 * a * r1 - a
@@ -36,12 +67,16 @@ def woa_optimize(obj, K, bounds=(1,254), pop=20, iters=100, seed=42):
                 X_new = D * np.exp(b * l) * np.cos(2*np.pi*l) + best
 
             X_new = np.clip(X_new, lb, ub)
-            fit_new = obj(X_new)
+            fit_new = budget.call(obj, X_new) if budget is not None else obj(X_new)
             if fit_new > fitness[i]:
                 X[i] = X_new
                 fitness[i] = fit_new
                 if fit_new > best_fit:
                     best_fit = fit_new
                     best = X_new.copy()
+        if budget is not None:
+            budget.step(best_fit)
 
+    if budget is not None:
+        budget.finish()
     return sorted_thresholds(best, K), best_fit
@@ -0,0 +1,99 @@
+import os, hashlib, threading, numpy as np
+from .dataset import read_gray
+
+# Cache trên đĩa cho histogram 256 mức và ảnh xám (uint8 .npy, đọc lại bằng memmap).
+# Khoá = đường dẫn tuyệt đối + kích thước + mtime (key="stat") hoặc sha1 nội dung file (key="content"),
+# nên file ảnh đổi thì khoá đổi và bản cache cũ không còn được dùng.
+
+def gray_hist(img):
+    """Normalized 256-bin histogram of a uint8 image."""
+    h = np.bincount(np.asarray(img).ravel(), minlength=256)[:256].astype(np.float64)
+    return h / (h.sum() + 1e-12)
+
+class ImageCache:
+    def __init__(self, cache_dir, key="stat", pixels=True):
+        if key not in ("stat", "content"):
+            raise ValueError("key must be 'stat' or 'content'")
+        self.dir = str(cache_dir)
+        self.key_mode = key
+        self.pixels = pixels
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()  # bộ đếm khi nhiều luồng giải mã cùng dùng cache
+        os.makedirs(self.dir, exist_ok=True)
+        self._keys = {}
+
+    def key(self, path):
+        st = os.stat(path)
+        sig = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        k = self._keys.get(sig)
+        if k is None:
+            if self.key_mode == "content":
+                d = hashlib.sha1()
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        d.update(block)
+            else:
+                d = hashlib.sha1(repr(sig).encode())
+            k = self._keys[sig] = d.hexdigest()[:24]
+        return k
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _file(self, path, kind):
+        return os.path.join(self.dir, f"{self.key(path)}.{kind}.npy")
+
+    def _load(self, fn, mmap=False):
+        try:
+            arr = np.load(fn, mmap_mode="r" if mmap else None)
+            self._count("hits")
+            return arr
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, fn, arr):
+        # ghi file tạm rồi đổi tên -> không để lại .npy dở dang khi nhiều tiến trình cùng ghi
+        tmp = f"{fn}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, fn)
+
+    def gray(self, path):
+        """uint8 gray image (a read-only memmap when cached)."""
+        if not self.pixels:
+            return read_gray(path)
+        fn = self._file(path, "gray")
+        img = self._load(fn, mmap=True) if os.path.exists(fn) else None
+        if img is None:
+            self._count("misses")
+            img = read_gray(path)
+            self._save(fn, np.ascontiguousarray(img, dtype=np.uint8))
+        return img
+
+    def hist(self, path, img=None):
+        """Normalized 256-bin histogram; img (if given) avoids decoding on a miss."""
+        fn = self._file(path, "hist")
+        h = self._load(fn) if os.path.exists(fn) else None
+        if h is None:
+            self._count("misses")
+            h = gray_hist(read_gray(path) if img is None else img)
+            self._save(fn, h)
+        return h
+
+    def fe_opt(self, path, K):
+        """Cached reference FE optimum of (path, K) for --gap, None on a miss."""
+        fn = self._file(path, f"feopt{int(K)}")
+        v = self._load(fn) if os.path.exists(fn) else None
+        if v is None:
+            self._count("misses")
+            return None
+        return float(v)
+
+    def put_fe_opt(self, path, K, value):
+        self._save(self._file(path, f"feopt{int(K)}"), np.float64(value))
+
+    def clear(self):
+        for fn in os.listdir(self.dir):
+            if fn.endswith(".npy") or fn.endswith(".tmp"):
+                os.remove(os.path.join(self.dir, fn))
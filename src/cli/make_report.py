@@ -2,6 +2,8 @@
 # Usage:
 #   python -m src.cli.make_report --in "results" --out "results/report.md"
 import os, csv, argparse, glob
+import numpy as np
+from ..results_store import aggregate
 
 def read_first(globpat):
     xs = sorted(glob.glob(globpat))
@@ -14,7 +16,8 @@ def main():
     args = ap.parse_args()
 
     metrics = read_first(os.path.join(args.indir, "metrics_*.csv"))
-    summary = read_first(os.path.join(args.indir, "summary_*.csv"))
+    store = read_first(os.path.join(args.indir, "results_*"))
+    results = store if store and os.path.isdir(store) else metrics
     fig_fe = read_first(os.path.join(args.indir, "summary_FE_*.png"))
     fig_dice = read_first(os.path.join(args.indir, "summary_Dice_*.png"))
 
@@ -25,19 +28,23 @@ def main():
     lines.append(f"- Thư mục kết quả: `{args.indir}`")
     lines.append("")
     lines.append("## 2. Bảng kết quả tổng hợp")
-    if summary:
-        lines.append(f"- File tổng hợp: `{os.path.basename(summary)}`")
+    if results:
+        # Tổng hợp trực tiếp từ store/metrics (đọc theo chunk), không cần summary_*.csv
+        agg = aggregate(results, metrics=("Dice", "IoU", "FE", "sec"))
+        lines.append(f"- Nguồn: `{os.path.basename(results)}` ({agg.rows} dòng)")
         lines.append("")
         # Chèn bảng tóm tắt (hiển thị 10 dòng đầu)
         lines.append("| algo_K | mean_dice | mean_iou | mean_FE | mean_sec | n |")
         lines.append("|---|---:|---:|---:|---:|---:|")
-        with open(summary, "r", newline="") as f:
-            rd = csv.DictReader(f)
-            for i, row in enumerate(rd):
-                if i >= 10: break
-                lines.append(f"| {row['algo_K']} | {row['mean_dice']} | {row['mean_iou']} | {row['mean_FE']} | {row['mean_sec']} | {row['n']} |")
+        for i, (algo, K, st) in enumerate(agg.summary()):
+            if i >= 10: break
+            m = [st[k][1] for k in ("Dice", "IoU", "FE", "sec")]
+            cells = " | ".join("" if np.isnan(v) else f"{v:.6g}" for v in m)
+            # n như summary_*.csv: số giá trị nhiều nhất trong Dice/IoU/FE (sec trống khi thiếu timing_*.csv)
+            n = max(st[k][0] for k in ("Dice", "IoU", "FE"))
+            lines.append(f"| {algo}_K{K} | {cells} | {n} |")
     else:
-        lines.append("- (Chưa có summary_*.csv. Hãy chạy với `--summary`)")
+        lines.append("- (Chưa có metrics_*.csv / results_*. Hãy chạy `run_experiment` trước)")
 
     lines.append("")
     lines.append("## 3. Biểu đồ so sánh")
@@ -51,21 +58,36 @@ def main():
     # Sigtest
     sig = read_first(os.path.join(args.indir, "sigtest_*.csv"))
     lines.append("")
-    lines.append("## 4. Kiểm định ý nghĩa thống kê (Wilcoxon)")
+    lines.append("## 4. Kiểm định ý nghĩa thống kê (Wilcoxon, sign test, bootstrap CI)")
     if sig:
         lines.append(f"- File: `{os.path.basename(sig)}`")
         lines.append("")
-        lines.append("| metric | K | mfwoa_vs | n_pairs | W_stat | p_value |")
-        lines.append("|---|---:|---|---:|---:|---:|")
+        lines.append("| metric | K | mfwoa_vs | n_pairs | W_stat | p_value | sign_p | mean_diff [95% CI] |")
+        lines.append("|---|---:|---|---:|---:|---:|---:|---|")
         with open(sig, "r", newline="") as f:
             rd = csv.DictReader(f)
             for row in rd:
-                lines.append(f"| {row['metric']} | {row['K']} | {row['mfwoa_vs']} | {row['n_pairs']} | {row['W_stat']} | {row['p_value']} |")
+                ci = "{:.4g} [{:.4g}, {:.4g}]".format(*(float(row[c]) for c in ("mean_diff", "ci_low", "ci_high"))) if row.get("mean_diff") else ""
+                lines.append(f"| {row['metric']} | {row['K']} | {row['mfwoa_vs']} | {row['n_pairs']} | {row['W_stat']} | {row['p_value']} | {row.get('sign_p') or ''} | {ci} |")
         lines.append("")
-        lines.append("> *Gợi ý diễn giải:* p-value nhỏ (< 0.05) với `alternative='greater'` cho thấy MFWOA **tốt hơn có ý nghĩa thống kê** so với thuật toán baseline trên metric & K tương ứng.")
+        lines.append("> *Gợi ý diễn giải:* p-value nhỏ (< 0.05) với `alternative='greater'` cho thấy MFWOA **tốt hơn có ý nghĩa thống kê** so với thuật toán baseline trên metric & K tương ứng; khoảng tin cậy bootstrap của chênh lệch trung bình không chứa 0 cũng cho cùng kết luận.")
     else:
         lines.append("- (Chưa có sigtest. Hãy chạy với `--sigtest`)")
 
+    # Friedman / Nemenyi
+    fr = read_first(os.path.join(args.indir, "friedman_*.csv"))
+    if fr:
+        lines.append("")
+        lines.append("## 5. Xếp hạng Friedman / Nemenyi")
+        lines.append(f"- File: `{os.path.basename(fr)}`")
+        lines.append("")
+        lines.append("| metric | K | algo | mean_rank | n_images | chi2 | p_value | CD | kém hơn hạng tốt nhất |")
+        lines.append("|---|---:|---|---:|---:|---:|---:|---:|:---:|")
+        with open(fr, "r", newline="") as f:
+            for row in csv.DictReader(f):
+                lines.append(f"| {row['metric']} | {row['K']} | {row['algo']} | {float(row['mean_rank']):.3f} | {row['n_images']} | "
+                             f"{float(row['chi2']):.4g} | {float(row['p_value']):.4g} | {float(row['nemenyi_cd']):.3f} | {'x' if row['worse_than_best'] == '1' else ''} |")
+
     with open(args.outfile, "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
     print("Report saved to:", args.outfile)
@@ -13,6 +13,7 @@ def main():
     ap.add_argument("--seed", type=int, default=42)
     ap.add_argument("--runs", type=int, default=1)
     ap.add_argument("--out", default="/mnt/data/results_bsds300_test")
+    ap.add_argument("--cache_dir", default=None, help="Reuse histograms/decoded pixels across calls")
     args = ap.parse_args()
 
     root = "/mnt/data/BSDS300/BSDS300/images/test"
@@ -31,6 +32,8 @@ def main():
         "--runs", str(args.runs),
         "--seed", str(args.seed),
     ]
+    if args.cache_dir:
+        cmd += ["--cache_dir", args.cache_dir, "--cache_gray"]
     print("Running:", " ".join(cmd))
     sys.exit(subprocess.call(cmd))
 
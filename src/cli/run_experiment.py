@@ -1,11 +1,15 @@
-import os, csv, time, argparse, numpy as np
+import os, sys, csv, copy, json, time, signal, argparse, threading, numpy as np
 from pathlib import Path
 from tqdm import tqdm
 
-from ..dataset import find_images, pair_masks, read_gray
-from ..utils import ensure_dir, set_seed, save_gray, overlay_mask, hungarian_match
-from ..metrics import dice_score, iou_score, psnr, ssim
-from ..fuzzy_entropy import fuzzy_entropy_objective
+from ..dataset import discover, read_gray, ImageLRU, ImageLoader
+from ..cache import ImageCache, gray_hist
+from ..results_store import ResultsWriter, store_from_csv, Pivot, iter_chunks
+from ..stats import compare_to, rank_tests
+from ..utils import ensure_dir, set_seed, save_gray, overlay_mask, hungarian_match, AsyncWriter
+from ..metrics import (ssim_labels, confusion_matrix, permute_confusion, dice_from_confusion, iou_from_confusion,
+                       accuracy_from_confusion, psnr_from_confusion, label_levels)
+from ..fuzzy_entropy import fuzzy_entropy_objective, CachedObjective
 from ..segmentation import apply_thresholds_to_image
 
 from ..algorithms.woa import woa_optimize
@@ -13,15 +17,28 @@ from ..algorithms.mfwoa import mfwoa_optimize
 from ..algorithms.pso import pso_optimize
 from ..algorithms.ga import ga_optimize
 from ..algorithms.otsu import multi_otsu_thresholds
+from ..algorithms.local_search import local_search
+from ..algorithms.common import Budget
+from ..algorithms.exhaustive import exhaustive_optimize, dp_optimize, reference_optimum
 
 def hist256(img):
-    h, _ = np.histogram(img, bins=256, range=(0,256))
-    p = h.astype(np.float64) / (h.sum() + 1e-12)
-    return p
+    return gray_hist(img)
 
-def run_single_algo_on_image(algo, K, img_gray, iters, pop, seed, save_curve=None, curve_key=None):
-    hist = hist256(img_gray)
+def make_objective(hist, K, memo=False, memo_size=None):
     obj = fuzzy_entropy_objective(hist, K=K, s=2.0)
+    return CachedObjective(obj, K, maxsize=memo_size) if memo else obj
+
+def add_memo_stats(stats, obj):
+    if stats is not None and isinstance(obj, CachedObjective):
+        stats["hits"] = stats.get("hits", 0) + obj.hits
+        stats["misses"] = stats.get("misses", 0) + obj.misses
+
+def run_single_algo_on_image(algo, K, img_gray, iters, pop, seed, save_curve=None, curve_key=None,
+                             memo=False, memo_size=None, memo_stats=None,
+                             vectorized=False, elitism=0, hist=None, budget=None, seeds=None, init_frac=1.0):
+    if hist is None:
+        hist = hist256(img_gray)
+    obj = make_objective(hist, K, memo=memo, memo_size=memo_size)
 
     history = []
     def wrapped_obj(x):
@@ -29,21 +46,35 @@ def run_single_algo_on_image(algo, K, img_gray, iters, pop, seed, save_curve=Non
         history.append(val)
         return val
 
+    def wrapped_batch(X):
+        vals = obj.batch(X)
+        history.extend(float(v) for v in vals)
+        return vals
+    wrapped_obj.batch = wrapped_batch
+
     if algo == "woa":
         use_obj = wrapped_obj if save_curve is not None else obj
-        T, best = woa_optimize(use_obj, K=K, pop=pop, iters=iters, seed=seed)
+        T, best = woa_optimize(use_obj, K=K, pop=pop, iters=iters, seed=seed, vectorized=vectorized, budget=budget,
+                               seeds=seeds, init_frac=init_frac)
     elif algo == "pso":
         use_obj = wrapped_obj if save_curve is not None else obj
-        T, best = pso_optimize(use_obj, K=K, pop=pop, iters=iters, seed=seed)
+        T, best = pso_optimize(use_obj, K=K, pop=pop, iters=iters, seed=seed, budget=budget,
+                               seeds=seeds, init_frac=init_frac)
     elif algo == "ga":
         use_obj = wrapped_obj if save_curve is not None else obj
-        T, best = ga_optimize(use_obj, K=K, pop=pop, iters=iters, seed=seed)
+        T, best = ga_optimize(use_obj, K=K, pop=pop, iters=iters, seed=seed, vectorized=vectorized, elitism=elitism,
+                              budget=budget, seeds=seeds, init_frac=init_frac)
     elif algo == "otsu":
-        thresholds = multi_otsu_thresholds((hist * 1e6).astype(int), classes=K+1)
+        thresholds = multi_otsu_thresholds(hist, classes=K+1)
         T = np.array(thresholds, dtype=np.int32)
         best = 0.0
+    elif algo == "exhaustive":
+        T, best = exhaustive_optimize(hist, K)
+    elif algo == "dp":
+        T, best = dp_optimize(hist, K)
     else:
         raise ValueError("Unknown algo: %s" % algo)
+    add_memo_stats(memo_stats, obj)
 
     if save_curve is not None and len(history) > 0:
         try:
@@ -56,6 +87,264 @@ def run_single_algo_on_image(algo, K, img_gray, iters, pop, seed, save_curve=Non
             print("[warn] cannot save curve:", e)
     return T, best
 
+def _save_seg(path, seg):
+    save_gray(path, (seg * (255 // max(1, seg.max()+1))).astype(np.uint8))
+
+_tls = threading.local()  # buffer overlay dùng lại cho mỗi luồng ghi
+
+def _save_overlay(path, img, seg, scale=1.0):
+    try:
+        from PIL import Image
+        n = int(seg.max()) + 1  # số lớp lấy trước khi thu nhỏ -> màu không đổi
+        step = max(1, int(round(1.0 / scale)))
+        if step > 1:
+            img, seg = img[::step, ::step], seg[::step, ::step]
+        buf = getattr(_tls, "overlay", None)
+        if buf is None or buf.shape[:2] != img.shape:
+            buf = _tls.overlay = np.empty(img.shape + (3,), dtype=np.uint8)
+        ovl = overlay_mask(img, seg, alpha=0.5, num_classes=n, out=buf)
+        Image.fromarray(ovl).save(path)
+    except Exception:
+        pass
+
+# Trạng thái dùng chung của mỗi tiến trình chạy cell (xem _init_cells)
+_CELL = {}
+
+def read_gt(path):
+    gt = read_gray(path)
+    # Heuristic chuẩn hoá GT đơn giản
+    return (gt / max(1, gt.max())).round().astype(np.uint8) if gt.max() > 1 and np.count_nonzero(np.bincount(gt.ravel()))<=3 else gt
+
+def _init_cells(hists, pairs, opts, imgs=None, cache_images=4, writer=None, gts=None):
+    # imgs/gts: ảnh/mask đã nạp sẵn (dict); None -> đọc lại từ đĩa qua LRU giới hạn cache_images ảnh,
+    # giải mã trước ảnh sắp dùng trên luồng nền (xem _run_task)
+    # writer: None -> mỗi tiến trình worker có AsyncWriter riêng, chờ ghi xong cuối mỗi tác vụ (_run_task)
+    # để lỗi ghi ảnh trả về tiến trình chính; Finalize chỉ là lưới an toàn khi worker thoát
+    _CELL.clear()
+    own_writer = writer is None
+    if writer is None:
+        from multiprocessing.util import Finalize
+        writer = AsyncWriter(opts["io_threads"])
+        Finalize(writer, writer.close, exitpriority=10)
+    loader = ImageCache(**opts["cache"]).gray if opts.get("cache") else None
+    decoder = ImageLoader(threads=opts["decode_threads"]) if imgs is None or gts is None else None
+    _CELL.update(hists=hists, pairs=pairs, opts=opts, writer=writer, own_writer=own_writer,
+                 imgs=imgs if imgs is not None else ImageLRU(cache_images, loader=loader, decoder=decoder),
+                 gts=gts if gts is not None else ImageLRU(cache_images, loader=read_gt, decoder=decoder))
+
+METRICS_HEADER = ["image","algo","K","run","FE","Dice","IoU","PSNR","SSIM","thresholds","FE_opt","gap","Acc","evals","stop"]
+TIMING_HEADER = ["image","algo","K","run","sec"]
+
+def _read_rows(path, header):
+    """Rows of a results CSV as dicts keyed by (image, algo, K, run); a torn last line is cut off."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            # bị dừng giữa chừng khi đang ghi -> bỏ dòng dở để ghi tiếp an toàn
+            f.truncate(data.rfind(b"\n") + 1)
+    with open(path, newline="") as f:
+        rd = csv.reader(f)
+        if next(rd, None) != header:
+            raise ValueError("%s has a different header; cannot resume into it" % path)
+        out = {}
+        for r in rd:
+            if len(r) == len(header):
+                d = dict(zip(header, r))
+                out[(d["image"], d["algo"], int(d["K"]), int(d["run"]))] = d
+        return out
+
+def _rewrite_rows(path, header, rows):
+    # ghi lại CSV chỉ với các dòng (dict) cho trước; file tạm + đổi tên để không mất dữ liệu khi bị dừng
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows([d[h] for h in header] for d in rows)
+    os.replace(tmp, path)
+
+def _run_task(groups, last=None, ahead=()):
+    """Run (joint, cells) groups in order; joint groups are one multitask MFWOA run.
+
+    With --init prev, the latest thresholds of each (image, algo) seed the next group, preferring
+    a solution with the same K. ahead: images of the next task, decoded in the background meanwhile.
+    """
+    ips = list(dict.fromkeys([c[0] for _, cells in groups for c in cells] + list(ahead)))
+    for lru, keys in ((_CELL["imgs"], ips), (_CELL["gts"], [_CELL["pairs"].get(ip) for ip in ips])):
+        if isinstance(lru, ImageLRU):
+            lru.prefetch([k for k in keys if k is not None])
+    out = []
+    last = {k: dict(v) for k, v in (last or {}).items()}
+    def prev(cell):
+        d = last.get((cell[0], cell[1]), {})
+        return d.get(cell[2], d.get(None))
+    for joint, cells in groups:
+        res = run_mf_group(cells, [prev(c) for c in cells]) if joint else [run_cell(*c, prev=prev(c)) for c in cells]
+        for c, r in zip(cells, res):
+            d = last.setdefault((c[0], c[1]), {})
+            d[c[2]] = d[None] = r[0][9]
+        out.extend(res)
+    if _CELL["own_writer"]:
+        # worker: ảnh của tác vụ phải ghi xong trước khi trả kết quả, lỗi ghi làm hỏng tác vụ
+        _CELL["writer"].drain()
+    return out
+
+def _in_cell_order(tasks, results):
+    """(cell index, result) in cell order from the per-task result lists."""
+    order = iter(sorted(i for idx in tasks for i in idx))
+    pending, nxt = {}, next(order, None)
+    for idx, res in zip(tasks, results):
+        pending.update(zip(idx, res))
+        while nxt in pending:
+            yield nxt, pending.pop(nxt)
+            nxt = next(order, None)
+
+def _reference_fe(key):
+    ip, K = key
+    return reference_optimum(_CELL["hists"][ip], K)[1]
+
+# các thuật toán có ngân sách/hạt giống/polish; otsu, exhaustive, dp là baseline/tham chiếu giữ nguyên
+_METAHEURISTICS = ("mfwoa", "woa", "pso", "ga")
+
+def _initial_evals(o, algo, n_tasks=1):
+    # số lần đánh giá của quần thể ban đầu (xem run_cell / run_mf_group)
+    if algo == "mfwoa":
+        return max(30, o["pop"], 2 * n_tasks) if n_tasks > 1 else max(30, o["pop"])
+    return o["pop"]
+
+def _make_budget(o, n_init):
+    # tiêu chí dừng (số lần đánh giá, thời gian, trì trệ) cho các metaheuristic; luôn đếm số lần đánh giá.
+    # n_init: quần thể ban đầu; ngân sách nhỏ hơn sẽ để lại cá thể chưa chấm điểm (-inf)
+    if o["max_evals"] is not None and o["max_evals"] < n_init:
+        raise ValueError(f"--max_evals {o['max_evals']} is smaller than the initial population ({n_init} evaluations)")
+    return Budget(max_evals=o["max_evals"], time_limit=o["time_limit"], patience=o["patience"], min_delta=o["min_delta"])
+
+def _warm_seeds(o, hist, K, prev):
+    seeds = []
+    init = o["init"].split("+")
+    if "otsu" in init:
+        seeds.append(multi_otsu_thresholds(hist, classes=K+1))
+    if "prev" in init and prev is not None:
+        seeds.append(prev)
+    return seeds
+
+def run_mf_group(cells, prevs=None):
+    """One MFWOA run for several (image, K) cells of the same run -> list of run_cell results.
+
+    All tasks share one population and one evaluation budget (evals/stop are those of the whole run);
+    --polish then works on a per-cell copy of what is left of it, so a row never depends on how
+    much its neighbours polished. prevs: optional previous thresholds per cell for --init prev.
+    """
+    o = _CELL["opts"]
+    run = cells[0][3]
+    t0 = time.time()
+    objs, Ks, seeds = [], [], []
+    for i, (ip, algo, K, _, _) in enumerate(cells):
+        hist = _CELL["hists"][ip]
+        objs.append(make_objective(hist, K, memo=o["memo"], memo_size=o["memo_size"]))
+        Ks.append(K)
+        seeds.append(_warm_seeds(o, hist, K, prevs[i] if prevs is not None else None))
+    budget = _make_budget(o, _initial_evals(o, "mfwoa", len(cells)))
+    Ts, fits = mfwoa_optimize(objs, Ks, pop=max(30, o["pop"], 2 * len(cells)), iters=o["iters"], rmp=o["rmp"],
+                               seed=o["seed"] + run, vectorized=o["vectorized"], budget=budget,
+                               seeds=seeds, init_frac=o["init_frac"])
+    share = (time.time() - t0) / len(cells)  # thời gian tối ưu chia đều cho các task
+    out = []
+    for (ip, algo, K, _, fe_ref), T, fit, obj in zip(cells, Ts, fits, objs):
+        memo_stats = {}
+        add_memo_stats(memo_stats, obj)
+        # bản sao chụp sau lần chạy chung: mọi dòng cùng evals/stop, polish của cell nào tính riêng cho cell đó
+        out.append(_finish_cell(ip, algo, K, run, T, float(fit), fe_ref, copy.copy(budget), memo_stats,
+                                time.time() - share))
+    return out
+
+def run_cell(ip, algo, K, run, fe_ref=None, prev=None):
+    """One (image, algo, K, run) cell -> (metrics row, summary row, memo stats).
+
+    fe_ref is the FE of the reference optimum for (image, K) when --gap is on;
+    prev the previous thresholds of the same (image, algo), used as a seed by --init prev.
+    """
+    o = _CELL["opts"]
+    hist = _CELL["hists"][ip]
+    img = _CELL["imgs"].get(ip)
+    out_root = o["out_root"]
+    run_seed = o["seed"] + run
+    memo_stats = {}
+    t0 = time.time()
+
+    curve_file = None
+    curve_key = f"{algo}_K{K}_run{run}_" + os.path.splitext(os.path.basename(ip))[0]
+    if o["curves"] and algo != "otsu":
+        curve_file = os.path.join(out_root, "curves", curve_key + ".png")
+
+    budget = _make_budget(o, _initial_evals(o, algo)) if algo in _METAHEURISTICS else None
+    seeds = _warm_seeds(o, hist, K, prev) if algo in _METAHEURISTICS else []
+
+    if algo == "mfwoa":
+        obj = make_objective(hist, K, memo=o["memo"], memo_size=o["memo_size"])
+        Ts, fits = mfwoa_optimize([obj], [K], pop=max(30, o["pop"]), iters=o["iters"], rmp=o["rmp"], seed=run_seed,
+                                   vectorized=o["vectorized"], budget=budget,
+                                   seeds=[seeds], init_frac=o["init_frac"])
+        T = Ts[0]; fe_val = float(fits[0])
+        add_memo_stats(memo_stats, obj)
+    else:
+        T, best = run_single_algo_on_image(algo, K, img, o["iters"], o["pop"], run_seed, save_curve=curve_file, curve_key=curve_key,
+                                           memo=o["memo"], memo_size=o["memo_size"], memo_stats=memo_stats,
+                                           vectorized=o["vectorized"],
+                                           elitism=o["elitism"], hist=hist, budget=budget,
+                                           seeds=seeds, init_frac=o["init_frac"])
+        fe_val = float(best) if algo != "otsu" else None
+    return _finish_cell(ip, algo, K, run, T, fe_val, fe_ref, budget, memo_stats, t0)
+
+def _finish_cell(ip, algo, K, run, T, fe_val, fe_ref, budget, memo_stats, t0):
+    # polish, gap, lưu ảnh và tính chỉ số cho lời giải T của một cell
+    o = _CELL["opts"]
+    hist = _CELL["hists"][ip]
+    img = _CELL["imgs"].get(ip)
+    out_root = o["out_root"]
+    if o["polish"] > 0 and algo in _METAHEURISTICS:
+        # polish tính vào cùng ngân sách (evals, time_limit) với thuật toán
+        T, fe_val = local_search(hist, K, T, max_moves=o["polish"], budget=budget)
+
+    gap_val = None
+    if fe_ref is not None:
+        gap_val = fe_ref - fuzzy_entropy_objective(hist, K=K, s=2.0)(T)
+
+    seg = apply_thresholds_to_image(img, T, mode='fuzzy', s=2.0)
+    bn = os.path.splitext(os.path.basename(ip))[0]
+    # PNG encode + overlay chạy ở luồng nền, không chặn vòng tính toán
+    writer = _CELL["writer"]
+    writer.submit(_save_seg, os.path.join(out_root, "seg", algo, f"K{K}", f"{bn}.png"), seg)
+    if not o["no_overlay"]:
+        writer.submit(_save_overlay, os.path.join(out_root, "overlay", algo, f"K{K}", f"{bn}.png"), img, seg, o["overlay_scale"])
+
+    # Metrics
+    mask_path = _CELL["pairs"].get(ip)
+    dsc = iou_val = P = S = acc = None
+    if mask_path is not None and os.path.exists(mask_path):
+        gt = _CELL["gts"].get(mask_path)
+        # một lần bincount cho cả Hungarian, Dice, IoU, Acc, PSNR
+        cm = confusion_matrix(seg, gt)
+        try:
+            perm = hungarian_match(seg, gt, cm=cm)
+        except Exception:
+            perm = np.arange(cm.shape[0], dtype=np.int32)
+        cm = permute_confusion(cm, perm)
+        dsc, _ = dice_from_confusion(cm)
+        iou_val, _ = iou_from_confusion(cm)
+        acc = accuracy_from_confusion(cm)
+        P = psnr_from_confusion(cm, label_levels(cm.sum(axis=1)), label_levels(cm.sum(axis=0)))
+        try:
+            # SSIM của hai ảnh nhãn (đã ghép nhãn), tính thẳng trên nhãn không dựng ảnh mức xám
+            S = ssim_labels(np.take(np.asarray(perm, dtype=np.uint8), seg, mode='clip'), gt)
+        except Exception:
+            S = None
+
+    row = [ip, algo, K, run, fe_val, dsc, iou_val, P, S, list(map(int, T)), fe_ref, gap_val, acc,
+           budget.evals if budget is not None else None, budget.reason if budget is not None else None]
+    return row, [ip, algo, K, run, dsc, iou_val, fe_val, time.time()-t0], memo_stats
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--dataset_root", required=True)
@@ -71,131 +360,312 @@ def main():
     ap.add_argument("--rmp", type=float, default=0.3)
     ap.add_argument("--curves", action="store_true", help="Save convergence curves")
     ap.add_argument("--summary", action="store_true", help="Write per-algo summary CSV and charts")
-    ap.add_argument("--sigtest", action="store_true", help="Wilcoxon test MFWOA vs each baseline (Dice/IoU)")
+    ap.add_argument("--sigtest", action="store_true", help="MFWOA vs each baseline (Wilcoxon, sign test, bootstrap CI) + Friedman/Nemenyi ranks over Dice/IoU/FE")
+    ap.add_argument("--store", default="none", choices=["none", "auto", "parquet", "npz"],
+                    help="Also write results as a columnar store results_<ts>/ (Parquet needs pyarrow; auto = Parquet if available, else NPZ)")
+    ap.add_argument("--store_chunk", type=int, default=65536, help="Rows per part file of --store")
     ap.add_argument("--debug_glob", action="store_true", help="Print debug info for file discovery")
+    ap.add_argument("--manifest", default=None, help="JSON list of images/mask pairs; written on first use, reused by later runs")
+    ap.add_argument("--manifest_refresh", action="store_true", help="Rebuild --manifest even if it exists")
+    ap.add_argument("--memo", action="store_true", help="Cache objective values by integer threshold tuple")
+    ap.add_argument("--memo_size", type=int, default=0, help="LRU bound for --memo (0 = unbounded)")
+    ap.add_argument("--polish", type=int, default=0, help="Hill-climb each metaheuristic result for at most N accepted moves (0 = off; otsu/exhaustive/dp are left as is). "
+                         "A quality convenience that adds time, not a speedup")
+    ap.add_argument("--vectorized", action="store_true", help="Whole-population array update steps for WOA/MFWOA/GA")
+    ap.add_argument("--elitism", type=int, default=0, help="GA: number of best individuals kept unchanged each generation")
+    ap.add_argument("--resume", action="store_true", help="Continue the latest metrics_*.csv in --out, skipping cells already recorded")
+    ap.add_argument("--workers", type=int, default=1, help="Process pool size for the image x algo x K x run grid (0 = all cores)")
+    ap.add_argument("--stream", action="store_true", help="Keep only histograms resident; decode pixels on demand, image-major order")
+    ap.add_argument("--cache_images", type=int, default=4, help="Decoded images kept in memory (LRU) with --stream or --workers")
+    ap.add_argument("--cache_dir", default=None, help="Persistent cache of per-image histograms (and gray pixels with --cache_gray)")
+    ap.add_argument("--cache_key", default="stat", choices=["stat", "content"], help="Cache key: path+size+mtime or sha1 of the file")
+    ap.add_argument("--cache_clear", action="store_true", help="Empty --cache_dir before running")
+    ap.add_argument("--cache_gray", action="store_true", help="Also cache decoded uint8 pixels as .npy (memory-mapped on reuse)")
+    ap.add_argument("--decode_threads", type=int, default=4, help="Threads decoding images/masks ahead of the compute loop (1 = decode inline)")
+    ap.add_argument("--prefetch", type=int, default=None, help="Max images decoded ahead during preload (default 2 x --decode_threads)")
+    ap.add_argument("--io_threads", type=int, default=2, help="Background threads for PNG/CSV output (0 = write synchronously)")
+    ap.add_argument("--no_overlay", action="store_true", help="Do not render/save overlay images")
+    ap.add_argument("--overlay_scale", type=float, default=1.0, help="Downsample saved overlays by this factor (e.g. 0.5)")
+    ap.add_argument("--mf_multitask", action="store_true", help="MFWOA solves all Ks of an image in one shared population")
+    ap.add_argument("--mf_batch", type=int, default=1, help="With --mf_multitask: images per MFWOA population (tasks = images x Ks)")
+    ap.add_argument("--init", default="random", choices=["random", "otsu", "prev", "otsu+prev"],
+                    help="Warm start: seed populations with Otsu thresholds and/or the previous solution of the same image/algo")
+    ap.add_argument("--init_frac", type=float, default=0.5, help="Fraction of the population seeded by --init")
+    ap.add_argument("--max_evals", type=int, default=None, help="Stop each optimizer after this many objective evaluations (incl. --polish moves; at least the initial population)")
+    ap.add_argument("--time_limit", type=float, default=None, help="Wall-clock budget (seconds) of each optimizer run per image")
+    ap.add_argument("--patience", type=int, default=None, help="Stop after this many iterations without improving the best by > --min_delta")
+    ap.add_argument("--min_delta", type=float, default=0.0, help="Minimum best-fitness gain that resets --patience")
+    ap.add_argument("--gap", action="store_true", help="Record the exact FE optimum (exhaustive search, K<=3 only; empty for larger K) and each result's gap to it. "
+                         "Costly: about 15 s per image at K=3 (0.1 s at K=2), computed once per (image, K) and kept in --cache_dir")
 
     args = ap.parse_args()
     set_seed(args.seed)
+    # SIGTERM (node bị thu hồi) -> thoát qua finally để flush các dòng kết quả đang đệm
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
 
-    image_paths = find_images(args.dataset_root, args.images_glob, debug=args.debug_glob)
+    image_paths, pairs, _ = discover(args.dataset_root, args.images_glob, args.masks_glob,
+                                     manifest=args.manifest, refresh=args.manifest_refresh,
+                                     debug=args.debug_glob)
     if len(image_paths) == 0:
         print("[ERROR] Không tìm thấy ảnh. Kiểm tra:")
         print(" - --dataset_root có đúng không?")
         print(" - --images_glob có khớp (ví dụ images/**/*.jpg) chưa?")
         print(" - Thử tạm --images_glob \"**/*.*\" để kiểm tra.")
-    pairs = pair_masks(image_paths, args.dataset_root, args.masks_glob)
 
     algos = [s.strip().lower() for s in args.algos.split(",") if s.strip()]
     Ks = [int(k) for k in args.Ks.split(",") if k.strip()]
+    if "exhaustive" in algos and max(Ks) > 3:
+        ap.error("exhaustive search is limited to K<=3; use 'dp' for larger K")
+    if args.overlay_scale <= 0:
+        ap.error(f"--overlay_scale must be > 0 (got {args.overlay_scale}); use --no_overlay to skip overlays")
+    if args.max_evals is not None:
+        o = dict(pop=args.pop)
+        n_tasks = len(Ks) * max(1, min(args.mf_batch, len(image_paths))) if args.mf_multitask else 1
+        need = max([_initial_evals(o, a, n_tasks if a == "mfwoa" else 1) for a in algos if a in _METAHEURISTICS] or [0])
+        if args.max_evals < need:
+            ap.error(f"--max_evals {args.max_evals} is smaller than the initial population ({need} evaluations); "
+                     "raise it or lower --pop" + (" / --mf_batch" if args.mf_multitask else ""))
+
+    memo_size = args.memo_size if args.memo_size > 0 else None
 
     ts = time.strftime("%Y%m%d-%H%M%S")
     out_root = os.path.join(args.out)
     ensure_dir(out_root)
 
+    # --resume: ghi tiếp vào metrics_*.csv mới nhất trong --out, bỏ qua các cell đã có
+    done_rows = {}
+    if args.resume:
+        import glob
+        found = sorted(glob.glob(os.path.join(out_root, "metrics_*.csv")))
+        if found:
+            ts = os.path.basename(found[-1])[len("metrics_"):-len(".csv")]
+            timing_found = os.path.join(out_root, f"timing_{ts}.csv")
+            try:
+                done_rows = _read_rows(found[-1], METRICS_HEADER)
+                timed = _read_rows(timing_found, TIMING_HEADER)
+            except ValueError as e:
+                ap.error(str(e))
+            if done_rows.keys() != timed.keys():
+                # bị dừng giữa lúc ghi metrics và timing: cell thiếu một trong hai dòng coi như chưa chạy
+                keep = done_rows.keys() & timed.keys()
+                print(f"[resume] {len(done_rows) - len(keep)} cells without a timing row will be recomputed")
+                done_rows = {k: v for k, v in done_rows.items() if k in keep}
+                _rewrite_rows(found[-1], METRICS_HEADER, done_rows.values())
+                _rewrite_rows(timing_found, TIMING_HEADER, [v for k, v in timed.items() if k in keep])
+            print(f"[resume] {found[-1]}: {len(done_rows)} cells already done")
     metrics_path = os.path.join(out_root, f"metrics_{ts}.csv")
-    with open(metrics_path, "w", newline="") as f:
-        wr = csv.writer(f)
-        wr.writerow(["image","algo","K","run","FE","Dice","IoU","PSNR","SSIM","thresholds"])
-
-    summary_rows = []
-
-    # Preload images
-    hists, imgs_gray = {}, {}
-    for ip in tqdm(image_paths, desc="Loading images"):
-        img = read_gray(ip)
-        imgs_gray[ip] = img
-        h = np.histogram(img, bins=256, range=(0,256))[0].astype(np.float64)
-        hists[ip] = h / (h.sum() + 1e-12)
-
-    for run in range(args.runs):
-        run_seed = args.seed + run
-        for K in Ks:
-            for algo in algos:
-                print(f"[Run {run}] Algo={algo} K={K}")
-                out_seg_dir = os.path.join(out_root, "seg", algo, f"K{K}")
-                out_ovl_dir = os.path.join(out_root, "overlay", algo, f"K{K}")
-                ensure_dir(out_seg_dir); ensure_dir(out_ovl_dir)
-
-                for ip in tqdm(image_paths, desc=f"{algo} K={K}"):
-                    t0 = time.time()
-                    img = imgs_gray[ip]
-                    fe_val = None
-
-                    curve_file = None
-                    curve_key = f"{algo}_K{K}_run{run}_" + os.path.splitext(os.path.basename(ip))[0]
-                    if args.curves and algo != "otsu":
-                        curves_dir = os.path.join(out_root, "curves")
-                        ensure_dir(curves_dir)
-                        curve_file = os.path.join(curves_dir, curve_key + ".png")
-
-                    if algo == "mfwoa":
-                        obj = fuzzy_entropy_objective(hists[ip], K=K, s=2.0)
-                        Ts, fits = mfwoa_optimize([obj], [K], pop=max(30, args.pop), iters=args.iters, rmp=args.rmp, seed=run_seed)
-                        T = Ts[0]; fe_val = float(fits[0])
-                    else:
-                        T, best = run_single_algo_on_image(algo, K, img, args.iters, args.pop, run_seed, save_curve=curve_file, curve_key=curve_key)
-                        fe_val = float(best) if algo != "otsu" else None
-
-                    seg = apply_thresholds_to_image(img, T, mode='fuzzy', s=2.0)
-                    bn = os.path.splitext(os.path.basename(ip))[0]
-                    save_gray(os.path.join(out_seg_dir, f"{bn}.png"), (seg * (255 // max(1, seg.max()+1))).astype(np.uint8))
-                    try:
-                        from PIL import Image
-                        ovl = overlay_mask(img, seg, alpha=0.5)
-                        Image.fromarray(ovl).save(os.path.join(out_ovl_dir, f"{bn}.png"))
-                    except Exception:
-                        pass
-
-                    # Metrics
-                    mask_path = pairs.get(ip)
-                    dsc = iou_val = P = S = None
-                    if mask_path is not None and os.path.exists(mask_path):
-                        gt = read_gray(mask_path)
-                        # Heuristic chuẩn hoá GT đơn giản
-                        gt = (gt / max(1, gt.max())).round().astype(np.uint8) if gt.max() > 1 and len(np.unique(gt))<=3 else gt
-                        try:
-                            perm = hungarian_match(seg, gt)
-                            seg_mapped = np.take(perm, seg, mode='clip')
-                        except Exception:
-                            seg_mapped = seg
-                        dsc, _ = dice_score(seg_mapped, gt)
-                        iou_val, _ = iou_score(seg_mapped, gt)
-                        P = psnr(seg_mapped*(255//(seg_mapped.max()+1)), gt*(255//(gt.max()+1)))
-                        try:
-                            S = ssim(seg_mapped*(255//(seg_mapped.max()+1)), gt*(255//(gt.max()+1)))
-                        except Exception:
-                            S = None
-
-                    with open(metrics_path, "a", newline="") as f:
-                        wr = csv.writer(f)
-                        wr.writerow([ip, algo, K, run, fe_val, dsc, iou_val, P, S, list(map(int, T))])
-
-                    summary_rows.append([ip, algo, K, run, dsc, iou_val, fe_val, time.time()-t0])
-
-    # Summary & charts
-    if args.summary and len(summary_rows) > 0:
-        import statistics
-        from collections import defaultdict
-        agg = defaultdict(lambda: {"dice": [], "iou": [], "fe": [], "sec": []})
-        per_img = defaultdict(dict)  # per image per algoK → (dice,iou,fe)
-
-        for ip, algo, K, run, dsc, iou_val, fe_val, sec in summary_rows:
-            key = f"{algo}_K{K}"
-            if dsc is not None: agg[key]["dice"].append(float(dsc))
-            if iou_val is not None: agg[key]["iou"].append(float(iou_val))
-            if fe_val is not None: agg[key]["fe"].append(float(fe_val))
-            agg[key]["sec"].append(float(sec))
-            per_img[(ip, K)][algo] = (dsc, iou_val, fe_val)
+    timing_path = os.path.join(out_root, f"timing_{ts}.csv")
+    for path, header in ((metrics_path, METRICS_HEADER), (timing_path, TIMING_HEADER)):
+        if not os.path.exists(path):
+            with open(path, "w", newline="") as f:
+                csv.writer(f).writerow(header)
+
+    # --store: bảng kết quả dạng cột (ngưỡng là mảng số nguyên); khi --resume dựng lại từ CSV trên đĩa
+    store_path = os.path.join(out_root, f"results_{ts}") if args.store != "none" else None
+    store = None
+    if store_path is not None:
+        try:
+            if done_rows:
+                store_from_csv(metrics_path, store_path, args.store, args.store_chunk)
+            store = ResultsWriter(store_path, args.store, args.store_chunk)
+        except (ImportError, ValueError) as e:
+            ap.error(str(e))
+
+    # Preload images (--stream: chỉ giữ histogram, ảnh được đọc lại qua LRU khi cần)
+    cache_cfg = dict(cache_dir=args.cache_dir, key=args.cache_key, pixels=args.cache_gray) if args.cache_dir else None
+    cache = ImageCache(**cache_cfg) if cache_cfg else None
+    if cache is not None and args.cache_clear:
+        cache.clear()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    n_cells = args.runs * len(Ks) * len(algos) * len(image_paths)
+    parallel = workers > 1 and n_cells > 1
+    # giữ ảnh + mask trong bộ nhớ chỉ khi chạy tuần tự và không --stream (worker tự đọc lại)
+    keep = not args.stream and not parallel
+
+    def preload(ip):
+        # chạy trên luồng giải mã: (ảnh, histogram, mask)
+        if cache is not None:
+            # histogram đã cache thì không cần giải mã ảnh
+            img = cache.gray(ip) if keep else None
+            h = cache.hist(ip, img)
+        else:
+            img = read_gray(ip)
+            h = hist256(img)
+        mp = pairs.get(ip)
+        gt = read_gt(mp) if keep and mp is not None and os.path.exists(mp) else None
+        return (img if keep else None), h, gt
+
+    hists, imgs_gray, gts = {}, {}, {}
+    with ImageLoader(threads=args.decode_threads, prefetch=args.prefetch) as decoder:
+        for ip, (img, h, gt) in tqdm(decoder.imap(image_paths, preload), total=len(image_paths),
+                                     desc="Loading images" if keep else "Histograms"):
+            hists[ip] = h
+            if keep:
+                imgs_gray[ip] = img
+                if gt is not None:
+                    gts[pairs[ip]] = gt
+            del img, gt
+    print(f"[decode] {decoder.summary()}")
+    if cache is not None:
+        print(f"[cache] {cache.dir}: {cache.hits} hits, {cache.misses} misses")
+
+    for K in Ks:
+        for algo in algos:
+            ensure_dir(os.path.join(out_root, "seg", algo, f"K{K}"))
+            ensure_dir(os.path.join(out_root, "overlay", algo, f"K{K}"))
+    if args.curves:
+        ensure_dir(os.path.join(out_root, "curves"))
 
+    opts = dict(out_root=out_root, iters=args.iters, pop=args.pop, seed=args.seed, rmp=args.rmp, curves=args.curves,
+                memo=args.memo, memo_size=memo_size, polish=args.polish,
+                vectorized=args.vectorized, elitism=args.elitism, cache=cache_cfg,
+                init=args.init, init_frac=args.init_frac, max_evals=args.max_evals, time_limit=args.time_limit, patience=args.patience, min_delta=args.min_delta,
+                io_threads=args.io_threads, no_overlay=args.no_overlay, overlay_scale=args.overlay_scale,
+                decode_threads=args.decode_threads)
+    writer = AsyncWriter(args.io_threads)  # dòng CSV (và ảnh khi chạy tuần tự)
+    pool = None
+    if parallel:
+        # worker chỉ nhận histogram (nhỏ), ảnh được đọc lại trong từng tiến trình
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=min(workers, n_cells), initializer=_init_cells,
+                                   initargs=(hists, pairs, opts, None, args.cache_images))
+    else:
+        _init_cells(hists, pairs, opts, imgs_gray if keep else None, args.cache_images, writer=writer,
+                    gts=gts if keep else None)
+    pmap = pool.map if pool is not None else map
+
+    # tối ưu tham chiếu cho --gap: tính một lần cho mỗi (ảnh, K), không lặp lại theo algo/run;
+    # chỉ K<=3 có tối ưu chính xác (exhaustive), K lớn hơn để trống FE_opt/gap
+    fe_opt = {}
+    if args.gap:
+        if any(K > 3 for K in Ks):
+            print("[gap] no exact optimum for K>3: FE_opt/gap left empty for those K")
+        keys = [(ip, K) for K in Ks if K <= 3 for ip in image_paths]
+        # --cache_dir: FE_opt chỉ phụ thuộc (ảnh, K) nên được lưu lại, lần chạy sau không duyệt lại
+        if cache is not None:
+            for k in keys:
+                v = cache.fe_opt(*k)
+                if v is not None:
+                    fe_opt[k] = v
+        todo = [k for k in keys if k not in fe_opt]
+        for k, v in zip(todo, pmap(_reference_fe, todo)):
+            fe_opt[k] = v
+            if cache is not None:
+                cache.put_fe_opt(*k, v)
+
+    if args.stream:
+        # ảnh ngoài cùng: mỗi ảnh được giải mã một lần mỗi run, mọi K/algo chạy khi ảnh còn trong bộ nhớ
+        cells = [(ip, algo, K, run, fe_opt.get((ip, K)))
+                 for run in range(args.runs) for ip in image_paths for K in Ks for algo in algos]
+    else:
+        cells = [(ip, algo, K, run, fe_opt.get((ip, K)))
+                 for run in range(args.runs) for K in Ks for algo in algos for ip in image_paths]
+    done = {i for i, c in enumerate(cells) if (c[0], c[1], c[2], c[3]) in done_rows}
+
+    # nhóm: (joint, [chỉ số cell]); joint = một lần MFWOA đa nhiệm cho mọi K của một lô ảnh trong cùng run
+    mf_batch = max(1, args.mf_batch)
+    batch_of = {ip: i // mf_batch for i, ip in enumerate(image_paths)}
+    groups, joint_groups = [], {}
+    for i, (ip, algo, K, run, _) in enumerate(cells):
+        if algo == "mfwoa" and args.mf_multitask:
+            key = (run, batch_of[ip])
+            if key not in joint_groups:
+                joint_groups[key] = (True, [])
+                groups.append(joint_groups[key])
+            joint_groups[key][1].append(i)
+        else:
+            groups.append((False, [i]))
+    # nhóm đã xong hết thì bỏ; nhóm MFWOA đa nhiệm xong một phần được chạy lại, chỉ ghi các dòng còn thiếu
+    groups = [(joint, idx) for joint, idx in groups if any(i not in done for i in idx)]
+    if "prev" in args.init.split("+"):
+        # cell phụ thuộc lời giải trước của cùng (ảnh, algo) -> mỗi chuỗi là một tác vụ chạy tuần tự
+        chains = {}
+        for joint, idx in groups:
+            ip, algo = cells[idx[0]][:2]
+            key = (batch_of[ip], algo) if joint else (ip, algo)
+            chains.setdefault(key, []).append((joint, idx))
+        tasks = list(chains.values())
+        chunk = len(algos)
+    else:
+        tasks = [[g] for g in groups]
+        chunk = len(Ks) * len(algos)
+    task_idx = [[i for _, idx in task for i in idx] for task in tasks]
+    task_cells = [[(joint, [cells[i] for i in idx]) for joint, idx in task] for task in tasks]
+    # lời giải đã có trên đĩa làm hạt giống --init prev cho phần còn lại của chuỗi
+    task_last = []
+    for task in tasks:
+        last = {}
+        keys = {cells[i][:2] for _, idx in task for i in idx}
+        for i in sorted(done):
+            ip, algo, K, run, _ = cells[i]
+            if (ip, algo) in keys:
+                T = json.loads(done_rows[(ip, algo, K, run)]["thresholds"])
+                d = last.setdefault((ip, algo), {})
+                d[K] = d[None] = T
+        task_last.append(last)
+    # ảnh của tác vụ kế tiếp (cùng worker: cùng chunk của pool.map) được giải mã trước trong lúc tính
+    chunksize = chunk if args.stream else 1
+    task_ahead = []
+    for j in range(len(task_cells)):
+        nxt = j + 1 < len(task_cells) and (pool is None or (j + 1) % chunksize != 0)
+        task_ahead.append([c[0] for _, cs in task_cells[j + 1] for c in cs] if nxt else [])
+    if pool is not None:
+        results = pool.map(_run_task, task_cells, task_last, task_ahead, chunksize=chunksize)
+    else:
+        results = map(_run_task, task_cells, task_last, task_ahead)
+
+    # kết quả được sắp lại theo thứ tự cells -> CSV giống hệt khi chạy tuần tự
+    try:
+        memo_stats = {}
+        group = None
+        bar = tqdm(total=len(cells) - len(done))
+        for i, (row, summary_row, cell_memo) in _in_cell_order(task_idx, results):
+            if i in done:
+                continue
+            ip, algo, K, run, _ = cells[i]
+            key = (run, ip) if args.stream else (run, K, algo)
+            if key != group:
+                group = key
+                bar.set_description(f"[Run {run}] " + (os.path.basename(ip) if args.stream else f"{algo} K={K}"))
+            writer.write_row(metrics_path, row)
+            writer.write_row(timing_path, summary_row[:4] + summary_row[-1:])
+            if store is not None:
+                store.write(row + summary_row[-1:])
+            st = memo_stats.setdefault((run, algo, K), {})
+            for k, v in cell_memo.items():
+                st[k] = st.get(k, 0) + v
+            bar.update(1)
+        bar.close()
+    finally:
+        # worker thoát -> ảnh của worker được ghi xong; sau đó flush CSV/ảnh của tiến trình chính
+        try:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        finally:
+            writer.close()
+            if store is not None:
+                store.close()
+
+    for (run, algo, K), st in memo_stats.items():
+        n_evals = st.get("hits", 0) + st.get("misses", 0)
+        if n_evals > 0:
+            print(f"[memo] run {run} {algo} K={K}: {st['hits']}/{n_evals} evaluations were repeats "
+                  f"({100.0 * st['hits'] / n_evals:.1f}% hit rate)")
+
+    # Summary & sigtest: một lượt đọc kết quả trên đĩa (store nếu có, không thì CSV) vào một Pivot dùng chung
+    pv = None
+    if args.summary or args.sigtest:
+        metrics = ["Dice", "IoU", "FE"] + (["sec"] if args.summary else [])
+        pv = Pivot(metrics).consume(iter_chunks(store_path if store is not None else metrics_path,
+                                                ["image", "algo", "K", "run"] + metrics))
+    if args.summary and pv.rows > 0:
+        stats = {f"{algo}_K{K}": st for algo, K, st in pv.summary()}
         sum_path = os.path.join(out_root, f"summary_{ts}.csv")
         with open(sum_path, "w", newline="") as sf:
             sw = csv.writer(sf); sw.writerow(["algo_K","mean_dice","mean_iou","mean_FE","mean_sec","n"])
-            for key, v in sorted(agg.items()):
-                n = max(len(v["dice"]), len(v["iou"]), len(v["fe"]))
-                md = statistics.mean(v["dice"]) if len(v["dice"])>0 else None
-                mi = statistics.mean(v["iou"])  if len(v["iou"])>0 else None
-                mf = statistics.mean(v["fe"])   if len(v["fe"])>0  else None
-                ms = statistics.mean(v["sec"])  if len(v["sec"])>0 else None
+            for key, st in sorted(stats.items()):
+                n = max(st[m][0] for m in ("Dice", "IoU", "FE"))
+                md, mi, mf, ms = (float(st[m][1]) if st[m][0] > 0 else None for m in ("Dice", "IoU", "FE", "sec"))
                 sw.writerow([key, md, mi, mf, ms, n])
 
         # Charts
@@ -203,18 +673,18 @@ def main():
             import matplotlib.pyplot as plt
             # FE bars (no GT)
             labels, fe_vals = [], []
-            for key, v in sorted(agg.items()):
-                if len(v["fe"])>0:
-                    labels.append(key); fe_vals.append(sum(v["fe"])/len(v["fe"]))
+            for key, st in sorted(stats.items()):
+                if st["FE"][0]>0:
+                    labels.append(key); fe_vals.append(st["FE"][1])
             if len(fe_vals)>0:
                 plt.figure(); plt.bar(labels, fe_vals); plt.xticks(rotation=45, ha='right')
                 plt.ylabel('Mean Fuzzy Entropy'); plt.title('MFWOA vs Baselines (FE)')
                 plt.tight_layout(); plt.savefig(os.path.join(out_root, f"summary_FE_{ts}.png")); plt.close()
             # Dice bars (with GT)
             labels, dice_vals = [], []
-            for key, v in sorted(agg.items()):
-                if len(v["dice"])>0:
-                    labels.append(key); dice_vals.append(sum(v["dice"])/len(v["dice"]))
+            for key, st in sorted(stats.items()):
+                if st["Dice"][0]>0:
+                    labels.append(key); dice_vals.append(st["Dice"][1])
             if len(dice_vals)>0:
                 plt.figure(); plt.bar(labels, dice_vals); plt.xticks(rotation=45, ha='right')
                 plt.ylabel('Mean Dice'); plt.title('MFWOA vs Baselines (Dice)')
@@ -222,66 +692,22 @@ def main():
         except Exception as e:
             print("[warn] cannot plot summary charts:", e)
 
-        # Wilcoxon signed-rank: MFWOA vs từng baseline (Dice/IoU)
-        if args.sigtest:
-            try:
-                from scipy.stats import wilcoxon
-                sig_path = os.path.join(out_root, f"sigtest_{ts}.csv")
-                with open(sig_path, "w", newline="") as sf:
-                    sw = csv.writer(sf); sw.writerow(["metric","K","mfwoa_vs","n_pairs","W_stat","p_value"])
-                    baselines = [a for a in algos if a != "mfwoa"]
-                    for K in Ks:
-                        for met_idx, met in enumerate(["dice","iou"]):
-                            x_mfwoa, y_base, who = [], [], []
-                            for (ip, k), d in per_img.items():
-                                if k != K: continue
-                                if "mfwoa" in d and any(b in d for b in baselines):
-                                    for base in baselines:
-                                        if base in d:
-                                            mval = d["mfwoa"][met_idx]
-                                            bval = d[base][met_idx]
-                                            if mval is not None and bval is not None:
-                                                x_mfwoa.append(mval); y_base.append(bval); who.append(base)
-                                    # chỉ lấy cặp đầu tiên mỗi baseline để không lặp
-                            # Test cho từng baseline
-                            for base in baselines:
-                                xv, yv = [], []
-                                for (ipk, d) in per_img.items():
-                                    pass
-                            # Làm test từng baseline riêng rẽ
-                            for base in baselines:
-                                X, Y = [], []
-                                for (ip, k), d in per_img.items():
-                                    if k != K: continue
-                                    if "mfwoa" in d and base in d:
-                                        mval = d["mfwoa"][met_idx]; bval = d[base][met_idx]
-                                        if mval is not None and bval is not None:
-                                            X.append(mval); Y.append(bval)
-                                if len(X) >= 5:
-                                    W, p = wilcoxon(X, Y, zero_method="wilcox", alternative="greater")
-                                    sw.writerow([met, K, base, len(X), float(W), float(p)])
-            except Exception as e:
-                print("[warn] cannot run wilcoxon:", e)
-                
-        from scipy.stats import wilcoxon
-        with open(sig_path, "a", newline="") as sf:
-            sw = csv.writer(sf)
-            # header đã có; chỉ bổ sung dòng mới cho metric='fe'
-            baselines = [a for a in algos if a != "mfwoa"]
-            for K in Ks:
-                for base in baselines:
-                    X, Y = [], []
-                    for (ip, k), d in per_img.items():
-                        if k != K: 
-                            continue
-                        if "mfwoa" in d and base in d:
-                            mf = d["mfwoa"][2]  # index 2 = FE theo cách mình lưu (dice, iou, fe)
-                            bv = d[base][2]
-                            if mf is not None and bv is not None:
-                                X.append(mf); Y.append(bv)
-                    if len(X) >= 5:
-                        W, p = wilcoxon(X, Y, zero_method="wilcox", alternative="greater")
-                        sw.writerow(["fe", K, base, len(X), float(W), float(p)])
+    # Kiểm định: MFWOA vs từng baseline (Wilcoxon, sign test, bootstrap CI) và Friedman/Nemenyi
+    # trên mọi (metric, K) cùng lúc, ghép cặp theo ảnh (trung bình qua các run)
+    if args.sigtest and pv.rows > 0:
+        try:
+            sig_path = os.path.join(out_root, f"sigtest_{ts}.csv")
+            with open(sig_path, "w", newline="") as sf:
+                sw = csv.writer(sf)
+                sw.writerow(["metric","K","mfwoa_vs","n_pairs","W_stat","p_value",
+                             "sign_pos","sign_neg","sign_p","mean_diff","ci_low","ci_high"])
+                sw.writerows(compare_to(pv, "mfwoa", baselines=algos, metrics=("Dice", "IoU", "FE"), seed=args.seed))
+            with open(os.path.join(out_root, f"friedman_{ts}.csv"), "w", newline="") as sf:
+                sw = csv.writer(sf)
+                sw.writerow(["metric","K","algo","mean_rank","n_images","chi2","p_value","nemenyi_cd","worse_than_best"])
+                sw.writerows(rank_tests(pv, algos, metrics=("Dice", "IoU", "FE")))
+        except Exception as e:
+            print("[warn] cannot run significance tests:", e)
 
     print(f"Done. Metrics saved to: {metrics_path}")
 
@@ -1,31 +1,157 @@
-import os, glob, numpy as np
+import os, re, glob, json, time, threading, numpy as np
+from collections import OrderedDict, deque
+from functools import lru_cache
 from pathlib import Path
 
 # Thêm .gif, .tif, .tiff
 IMG_EXT = ('.png','.jpg','.jpeg','.bmp','.tif','.tiff','.gif')
 
-def find_images(root, images_glob=None, debug=False):
+# Danh sách phần mở rộng thử cho mask
+TRY_EXTS = ['.png','.jpg','.jpeg','.bmp','.tif','.tiff','.gif']
+
+def _glob_parts(pattern):
+    # glob tương đối theo root, tách theo '/' (chấp nhận cả backslash), bỏ '' và '.'
+    return [p for p in pattern.replace('\\', '/').split('/') if p not in ('', '.')]
+
+def _outside_root(pattern):
+    # glob tuyệt đối hoặc có '..' có thể ra ngoài root -> không tra bằng DatasetIndex được
+    return os.path.isabs(pattern) or '..' in _glob_parts(pattern)
+
+def _glob_regex(pattern):
+    """Compile a glob (relative, '/'-separated, '**' = any number of directories) to a regex.
+
+    Case-insensitive where the OS compares paths that way (os.path.normcase folds case), like glob.glob.
+    """
+    out, parts = [], _glob_parts(pattern)
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == '**':
+            out.append('.*' if last else '(?:.+/)?')
+            continue
+        j = 0
+        while j < len(part):
+            c = part[j]
+            if c == '*':
+                out.append('[^/]*')
+            elif c == '?':
+                out.append('[^/]')
+            elif c == '[' and part.find(']', j + 2) > 0:
+                k = part.find(']', j + 2)
+                body = part[j + 1:k]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                j = k
+            else:
+                out.append(re.escape(c))
+            j += 1
+        if not last:
+            out.append('/')
+    return re.compile(''.join(out) + r'\Z', re.IGNORECASE if os.path.normcase('A') == 'a' else 0)
+
+class DatasetIndex:
+    """One os.scandir walk of root: every file by directory and stem.
+
+    Hidden entries are skipped like glob does. Directories outside root (e.g. a masks folder next
+    to an images root) are listed lazily, once each, when a lookup needs them.
+    """
+    def __init__(self, root):
+        self.root = str(root)
+        self._prefix = os.path.join(self.root, '')
+        self.files = []         # đường dẫn tương đối dạng '/', đã sắp xếp
+        self._dirs = {}         # thư mục -> {stem: {ext: tên file}}
+        self._walk()
+        self.files.sort()
+
+    @staticmethod
+    def _key(d):
+        return os.path.normpath(os.path.normcase(d))
+
+    def _scan(self, d, rel=None):
+        stems, subdirs, normcase = {}, [], os.path.normcase
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    if e.name.startswith('.'):
+                        continue
+                    try:
+                        is_dir = e.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        subdirs.append(e.name)
+                        continue
+                    name = normcase(e.name)
+                    i = name.rfind('.')
+                    stem, ext = (name[:i], name[i:]) if i > 0 else (name, '')
+                    stems.setdefault(stem, {})[ext] = e.name
+                    if rel is not None:
+                        self.files.append(rel + e.name)
+        except OSError:
+            pass
+        self._dirs[self._key(d)] = stems
+        return subdirs
+
+    def _walk(self):
+        stack = [(self.root, '')]
+        while stack:
+            d, rel = stack.pop()
+            for name in self._scan(d, rel):
+                stack.append((os.path.join(d, name), rel + name + '/'))
+
+    def _path(self, rel):
+        return self._prefix + (rel if os.sep == '/' else rel.replace('/', os.sep))
+
+    def glob(self, pattern):
+        """Files under root matching a root-relative glob (recursive '**' like glob.glob)."""
+        rx = _glob_regex(pattern)
+        return [self._path(f) for f in self.files if rx.match(f)]
+
+    def by_ext(self, exts, recursive=True, fold_case=True):
+        """Files whose extension is in exts (lower-cased first if fold_case, else as the OS compares)."""
+        norm = str.lower if fold_case else os.path.normcase
+        exts = {norm(e) for e in exts}
+        out = []
+        for f in self.files:
+            i, j = f.rfind('.'), f.rfind('/')
+            if (recursive or j < 0) and i > j + 1 and norm(f[i:]) in exts:
+                out.append(self._path(f))
+        return out
+
+    def find(self, d, stem, exts):
+        """First path d/stem+ext existing for ext in exts (in order), else None."""
+        k = self._key(d)
+        if k not in self._dirs:
+            self._scan(d)
+        names = self._dirs[k].get(os.path.normcase(stem))
+        if names:
+            for ext in exts:
+                name = names.get(os.path.normcase(ext))
+                if name is not None:
+                    return os.path.join(d, name)
+        return None
+
+def find_images(root, images_glob=None, debug=False, index=None):
     root = str(root)
-    if images_glob is None:
-        files = []
-        for ext in IMG_EXT:
-            files.extend(glob.glob(os.path.join(root, f"*{ext}")))
-        if len(files) == 0:
-            for ext in IMG_EXT:
-                files.extend(glob.glob(os.path.join(root, "**", f"*{ext}"), recursive=True))
+    if images_glob is not None and _outside_root(images_glob):
+        files = [os.path.normpath(f) for f in glob.glob(os.path.join(root, images_glob), recursive=True)]
     else:
-        # Hỗ trợ cả backslash & forward-slash trong glob (Windows/Unix)
-        pattern1 = os.path.join(root, images_glob)
-        pattern2 = os.path.join(root, images_glob.replace('\\', '/'))
-        files = glob.glob(pattern1, recursive=True)
-        if len(files) == 0 and pattern2 != pattern1:
-            files = glob.glob(pattern2, recursive=True)
-        # Fallback: quét toàn bộ rồi lọc theo đuôi hợp lệ
-        if len(files) == 0:
-            files = glob.glob(os.path.join(root, "**", "*.*"), recursive=True)
-            files = [f for f in files if os.path.splitext(f)[1].lower() in IMG_EXT]
-
-    files = sorted(list(set(files)))
+        index = index or DatasetIndex(root)
+        if images_glob is None:
+            # ảnh ngay trong root, nếu không có thì quét đệ quy
+            files = index.by_ext(IMG_EXT, recursive=False, fold_case=False)
+            if len(files) == 0:
+                files = index.by_ext(IMG_EXT, fold_case=False)
+        else:
+            # Hỗ trợ cả backslash & forward-slash trong glob (Windows/Unix)
+            files = index.glob(images_glob)
+            # Fallback: quét toàn bộ rồi lọc theo đuôi hợp lệ
+            if len(files) == 0:
+                files = index.by_ext(IMG_EXT)
+                print(f"[find_images] warning: images_glob={images_glob!r} matched nothing under {root}; "
+                      f"using all {len(files)} image files found recursively instead")
+
+    files = sorted(set(files))
     if debug:
         print(f"[find_images] root={root}")
         print(f"[find_images] images_glob={images_glob}")
@@ -34,65 +160,246 @@ def find_images(root, images_glob=None, debug=False):
             print("  sample:", files[:3])
     return files
 
-def pair_masks(image_paths, root, masks_glob=None):
-    pairs = {}
-    mask_candidates = []
-    if masks_glob is not None:
-        mask_candidates = sorted(glob.glob(os.path.join(root, masks_glob), recursive=True))
-
+def pair_masks(image_paths, root, masks_glob=None, index=None):
+    index = index or DatasetIndex(root)
     # Lập chỉ mục mask theo basename (không extension)
-    index = {}
-    for m in mask_candidates:
-        bn = os.path.splitext(os.path.basename(m))[0]
-        index[bn] = m
-
-    # Danh sách phần mở rộng thử cho mask
-    TRY_EXTS = ['.png','.jpg','.jpeg','.bmp','.tif','.tiff','.gif']
+    by_stem = {}
+    if masks_glob is not None:
+        mask_candidates = (sorted(map(os.path.normpath, glob.glob(os.path.join(str(root), masks_glob), recursive=True)))
+                           if _outside_root(masks_glob) else index.glob(masks_glob))
+        for m in mask_candidates:
+            by_stem[os.path.splitext(os.path.basename(m))[0]] = m
 
+    pairs = {}
     for ip in image_paths:
         bn = os.path.splitext(os.path.basename(ip))[0]
-        m = index.get(bn)
-
+        m = by_stem.get(bn)
         if m is None:
-            # Chuẩn hoá để replace ổn định (Windows/Unix)
+            # Chuẩn hoá để replace ổn định (Windows/Unix); thử 'images' -> 'masks' rồi 'mask'
             ip_norm = ip.replace("\\", "/")
+            for sub in ("/masks/", "/mask/"):
+                guess = ip_norm.replace("/images/", sub)
+                if guess != ip_norm:
+                    m = index.find(os.path.dirname(guess), bn, TRY_EXTS)
+                    if m is not None:
+                        break
+            # Nếu ảnh & mask cùng thư mục: thử hậu tố _mask
+            if m is None:
+                m = index.find(os.path.dirname(ip), bn + "_mask", TRY_EXTS)
+        pairs[ip] = m
+    return pairs
 
-            # Thử thay 'images' -> 'masks' hoặc 'mask'
-            guess_masks = ip_norm.replace("/images/", "/masks/")
-            guess_mask  = ip_norm.replace("/images/", "/mask/")
+MANIFEST_VERSION = 2
 
-            candidates = []
+def _manifest_dirs(root, paths):
+    # thư mục chứa ảnh/mask và các thư mục cha tới root: thêm/xoá/đổi tên file con làm đổi mtime của chúng
+    root = os.path.normpath(os.path.abspath(str(root)))
+    dirs = {root}
+    for p in paths:
+        d = os.path.normpath(os.path.dirname(os.path.abspath(p)))
+        while d not in dirs:
+            dirs.add(d)
+            parent = os.path.dirname(d)
+            if parent == d or not (d + os.sep).startswith(root + os.sep):
+                break
+            d = parent
+    return sorted(dirs)
 
-            # Nếu đã đổi path, thử các đuôi phổ biến với cùng basename
-            for guess in [guess_masks, guess_mask]:
-                if guess != ip_norm:
-                    d = os.path.dirname(guess)
-                    base = os.path.splitext(os.path.basename(guess))[0]
-                    for ext in TRY_EXTS:
-                        candidates.append(os.path.join(d, base + ext))
+def _dir_mtimes(dirs):
+    return {d: os.stat(d).st_mtime_ns for d in dirs}
 
-            # Nếu ảnh & mask cùng thư mục: thử hậu tố _mask
-            dirn = os.path.dirname(ip)
-            for ext in TRY_EXTS:
-                candidates.append(os.path.join(dirn, bn + "_mask" + ext))
+def load_manifest(path, root, images_glob=None, masks_glob=None):
+    """(image_paths, pairs) saved by save_manifest for the same root/globs, else None.
 
-            # Chọn ứng viên đầu tiên tồn tại
-            for cand in candidates:
-                if os.path.exists(cand):
-                    m = cand
-                    break
+    Also None when a recorded directory (root, every image/mask folder and the folders between)
+    changed since, so files added, removed or renamed there trigger a rescan.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            man = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (man.get("version") != MANIFEST_VERSION or man.get("root") != str(root)
+            or man.get("images_glob") != images_glob or man.get("masks_glob") != masks_glob):
+        return None
+    try:
+        if _dir_mtimes(man["dirs"]) != man["dirs"]:
+            return None
+    except OSError:
+        return None
+    return man["images"], dict(zip(man["images"], man["masks"]))
 
-        pairs[ip] = m if (m is not None and os.path.exists(m)) else None
-    return pairs
+def save_manifest(path, root, images_glob, masks_glob, image_paths, pairs):
+    man = {"version": MANIFEST_VERSION, "root": str(root), "images_glob": images_glob,
+           "masks_glob": masks_glob, "images": list(image_paths),
+           "masks": [pairs.get(ip) for ip in image_paths],
+           "dirs": _dir_mtimes(_manifest_dirs(root, list(image_paths) + [m for m in pairs.values() if m]))}
+    d = os.path.dirname(os.path.abspath(path))
+    os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(man, f)
+    os.replace(tmp, path)
 
-def read_gray(path):
+def discover(root, images_glob=None, masks_glob=None, manifest=None, refresh=False, debug=False):
+    """find_images + pair_masks over one DatasetIndex, reusing/writing a JSON manifest if given.
+
+    Returns (image_paths, pairs, from_manifest).
+    """
+    if manifest and not refresh and os.path.exists(manifest):
+        got = load_manifest(manifest, root, images_glob, masks_glob)
+        if got is not None:
+            if debug:
+                print(f"[find_images] manifest={manifest} found={len(got[0])}")
+            return got[0], got[1], True
+    index = DatasetIndex(root)
+    image_paths = find_images(root, images_glob, debug=debug, index=index)
+    pairs = pair_masks(image_paths, root, masks_glob, index=index)
+    if manifest and image_paths:
+        save_manifest(manifest, root, images_glob, masks_glob, image_paths, pairs)
+    return image_paths, pairs, False
+
+@lru_cache(maxsize=None)
+def _cv2():
+    # chọn backend một lần: OpenCV nếu có, không thì Pillow
     try:
         import cv2
-        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-        if img is not None:
-            return img
+        return cv2
     except Exception:
-        pass
+        return None
+
+def read_gray(path):
+    cv2 = _cv2()
+    if cv2 is not None:
+        try:
+            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if img is not None:
+                return img
+        except Exception:
+            pass
+    # Pillow: GIF hoặc định dạng OpenCV không đọc được
     from PIL import Image
-    img = Image.open(path).convert("L")
-    return np.array(img, dtype=np.uint8)
+    with Image.open(path) as img:
+        return np.array(img.convert("L"), dtype=np.uint8)
+
+class ImageLoader:
+    """Decodes files on a thread pool (OpenCV and Pillow release the GIL while decoding).
+
+    imap(paths) yields (path, result) in input order with at most `prefetch` decodes in flight;
+    submit() schedules one decode. count/nbytes/busy/wall accumulate for summary().
+    """
+    def __init__(self, loader=None, threads=4, prefetch=None):
+        self.loader = loader or read_gray
+        self.threads = max(1, int(threads))
+        self.prefetch = max(1, int(prefetch or 2 * self.threads))
+        self._pool = None
+        if self.threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix="decode")
+        self._lock = threading.Lock()
+        self.count = self.nbytes = 0
+        self.busy = self.wall = 0.0
+
+    def _load(self, path, loader):
+        t0 = time.perf_counter()
+        out = loader(path)
+        dt = time.perf_counter() - t0
+        arrays = out if isinstance(out, tuple) else (out,)
+        n = sum(a.nbytes for a in arrays if isinstance(a, np.ndarray))
+        with self._lock:
+            self.count += 1
+            self.nbytes += n
+            self.busy += dt
+        return out
+
+    def submit(self, path, loader=None):
+        """Future of loader(path), or None when running without threads."""
+        if self._pool is None:
+            return None
+        return self._pool.submit(self._load, path, loader or self.loader)
+
+    def imap(self, paths, loader=None):
+        loader = loader or self.loader
+        t0 = time.perf_counter()
+        try:
+            if self._pool is None:
+                for p in paths:
+                    yield p, self._load(p, loader)
+                return
+            it, pending = iter(paths), deque()
+            try:
+                while True:
+                    for p in it:
+                        pending.append((p, self._pool.submit(self._load, p, loader)))
+                        if len(pending) >= self.prefetch:
+                            break
+                    if not pending:
+                        break
+                    p, fut = pending.popleft()
+                    yield p, fut.result()
+            finally:
+                for _, fut in pending:
+                    fut.cancel()
+        finally:
+            self.wall += time.perf_counter() - t0
+
+    def summary(self):
+        mb = self.nbytes / 2**20
+        rate = self.count / self.wall if self.wall > 0 else float("inf")
+        mbs = mb / self.wall if self.wall > 0 else float("inf")
+        return (f"{self.count} files, {mb:.1f} MB decoded in {self.wall:.2f}s "
+                f"({rate:.1f} files/s, {mbs:.1f} MB/s; {self.threads} threads busy {self.busy:.2f}s)")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ImageLRU:
+    """Decoded gray images keyed by path; at most maxsize of them stay in memory.
+
+    With a decoder (ImageLoader), prefetch(paths) starts decoding upcoming paths in the background.
+    """
+    def __init__(self, maxsize=4, loader=None, decoder=None):
+        self.maxsize = max(1, int(maxsize))
+        self.loader = loader or read_gray
+        self.decoder = decoder
+        self._imgs = OrderedDict()
+        self._pending = {}
+        self.loads = 0
+
+    def prefetch(self, paths):
+        if self.decoder is None:
+            return
+        want = [p for p in dict.fromkeys(paths) if p not in self._imgs][:self.maxsize]
+        # ảnh đã hẹn trước nhưng không còn cần -> bỏ
+        for p in list(self._pending):
+            if p not in want:
+                self._pending.pop(p).cancel()
+        for p in want:
+            if p not in self._pending:
+                fut = self.decoder.submit(p, self.loader)
+                if fut is None:
+                    return
+                self._pending[p] = fut
+
+    def get(self, path):
+        img = self._imgs.get(path)
+        if img is not None:
+            self._imgs.move_to_end(path)
+            return img
+        fut = self._pending.pop(path, None)
+        img = fut.result() if fut is not None else self.loader(path)
+        self.loads += 1
+        self._imgs[path] = img
+        if len(self._imgs) > self.maxsize:
+            self._imgs.popitem(last=False)
+        return img
+
+    def __len__(self):
+        return len(self._imgs)
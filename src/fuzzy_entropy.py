@@ -1,5 +1,7 @@
 
 import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
 
 def sigmoid(x):
     return 1.0 / (1.0 + np.exp(-x))
@@ -11,38 +13,298 @@ def sorted_thresholds(vec, K):
             v[i] = min(254, v[i-1] + 1)
     return v
 
+def sorted_thresholds_batch(X, K):
+    """Row-wise sorted_thresholds for a (pop, >=K) matrix."""
+    V = np.clip(np.sort(np.round(np.asarray(X)[:, :K]).astype(np.int32), axis=1), 1, 254)
+    for i in range(1, V.shape[1]):
+        V[:, i] = np.where(V[:, i] <= V[:, i-1], np.minimum(254, V[:, i-1] + 1), V[:, i])
+    return V
+
+@lru_cache(maxsize=8)
+def membership_tables(s=2.0):
+    """(A, B) with A[t] = sigmoid((t - bins)/s) and B[t] = sigmoid((bins - t)/s) for t in 0..255."""
+    bins = np.arange(256, dtype=np.float64)
+    D = (bins[:, None] - bins[None, :]) / s
+    A, B = sigmoid(D), sigmoid(-D)
+    A.flags.writeable = False
+    B.flags.writeable = False
+    return A, B
+
+def memberships(T, s=2.0):
+    """Normalized memberships (pop, K+1, 256) for a threshold matrix T (pop, K)."""
+    T = np.asarray(T)
+    if np.issubdtype(T.dtype, np.integer) and T.min() >= 0 and T.max() <= 255:
+        At, Bt = membership_tables(float(s))
+        A, B = At[T], Bt[T]
+    else:
+        bins = np.arange(256, dtype=np.float64)
+        Tf = T.astype(np.float64)[:, :, None]
+        A, B = sigmoid((Tf - bins) / s), sigmoid((bins - Tf) / s)
+    # A: mu "below" each threshold, B: mu "above" each threshold
+    mu = np.concatenate([A[:, :1], B[:, :-1] * A[:, 1:], B[:, -1:]], axis=1)
+    mu /= mu.sum(axis=1, keepdims=True) + 1e-12
+    return mu
+
+def fuzzy_entropy_batch(hist, T, s=2.0):
+    """Fuzzy entropy of every row of an integer threshold matrix T (pop, K)."""
+    mu = memberships(T, s=s)
+    fe = -(mu * np.log(mu + 1e-12)).sum(axis=1)
+    return fe @ np.asarray(hist, dtype=np.float64)
+
+def band_halfwidth(s=2.0, tol=1e-6):
+    """Distance (in bins) beyond which both sigmoids are within tol of 0 or 1."""
+    return int(np.ceil(s * np.log((1.0 - tol) / tol)))
+
+@lru_cache(maxsize=8)
+def _edge_tables(s=2.0):
+    """membership_tables plus two saturated sentinel edges: row 256 (far left) and 257 (far right)."""
+    A, B = membership_tables(s)
+    A = np.vstack([A, np.zeros(256), np.ones(256)])
+    B = np.vstack([B, np.ones(256), np.zeros(256)])
+    A.flags.writeable = False
+    B.flags.writeable = False
+    return A, B
+
+def fuzzy_entropy_banded(hist, T, s=2.0, tol=1e-6):
+    """fuzzy_entropy_batch restricted to bands of half-width band_halfwidth(s, tol) around each threshold.
+
+    Outside the bands every bin is (up to tol) crisp, so its entropy is the constant of a
+    one-hot membership and its total contribution comes from histogram prefix sums. Inside
+    band k only thresholds k-1..k+1 are resolved; candidates whose thresholds k+-2 still
+    reach into band k are scored with the dense version instead. Only used by
+    scripts/bench_objective.py to check the saturation argument: the per-band gathers cost
+    more than the dense table lookups of fuzzy_entropy_batch at every K, so no objective uses it.
+    """
+    hist = np.asarray(hist, dtype=np.float64)
+    T = np.asarray(T)
+    P, K = T.shape
+    w = band_halfwidth(s, tol)
+    At, Bt = _edge_tables(float(s))
+
+    # Non-overlapping bands [lo_k, hi_k]: each starts after the previous one ends
+    hi = np.minimum(T + w, 255)
+    lo = np.maximum(T - w, 0)
+    lo[:, 1:] = np.maximum(lo[:, 1:], hi[:, :-1] + 1)
+    idx = lo[:, :, None] + np.arange(2 * w + 1)
+    valid = idx <= hi[:, :, None]
+    idx = np.minimum(idx, 255)
+
+    # Edges seen by band k: [far left, t_{k-1}, t_k, t_{k+1}, far right]
+    Tp = np.concatenate([np.full((P, 1), 256), T, np.full((P, 1), 257)], axis=1)
+    k = np.arange(K)
+    E = np.stack([np.zeros(K, dtype=int), k, k + 1, k + 2, np.full(K, K + 1)], axis=1)
+    Te = Tp[:, E][..., None]                                 # (P, band, edge, 1)
+    ib = idx[:, :, None, :]
+    A, B = At[Te, ib], Bt[Te, ib]
+    mu = B[:, :, :-1] * A[:, :, 1:]                          # classes k-1..k+2
+    mu /= mu.sum(axis=2, keepdims=True) + 1e-12
+    fe = -(mu * np.log(mu + 1e-12)).sum(axis=2)
+    band_fe = (fe * hist[idx] * valid).sum(axis=(1, 2))
+
+    cs = np.concatenate([[0.0], np.cumsum(hist)])
+    band_mass = np.maximum(cs[hi + 1] - cs[lo], 0.0).sum(axis=1)
+    out = band_fe + _crisp_entropy(K) * (cs[-1] - band_mass)
+
+    # Thresholds two positions away must be saturated over the whole band
+    far = np.zeros(P, dtype=bool)
+    if K > 2:
+        far |= (lo[:, 2:] - T[:, :-2] < w).any(axis=1)
+        far |= (T[:, 2:] - hi[:, :-2] < w).any(axis=1)
+    if far.any():
+        out[far] = fuzzy_entropy_batch(hist, T[far], s=s)
+    return out
+
+@lru_cache(maxsize=32)
+def _crisp_entropy(K):
+    mu = np.zeros(K + 1)
+    mu[0] = 1.0
+    mu /= mu.sum() + 1e-12
+    return float(-(mu * np.log(mu + 1e-12)).sum())
+
 def fuzzy_entropy_objective(hist, K, s=2.0):
-    bins = np.arange(256, dtype=np.float32)
+    def fe_batch(X):
+        return fuzzy_entropy_batch(hist, sorted_thresholds_batch(X, K), s=s)
 
     def fe_score(x):
-        T = sorted_thresholds(x, K)
-        Kp1 = K + 1
-        mu = np.zeros((Kp1, 256), dtype=np.float64)
-        mu[0] = sigmoid((T[0] - bins) / s)
-        mu[K] = sigmoid((bins - T[-1]) / s)
-        for j in range(1, K):
-            left = sigmoid((bins - T[j-1]) / s)
-            right = sigmoid((T[j] - bins) / s)
-            mu[j] = left * right
-        denom = mu.sum(axis=0, keepdims=True) + 1e-12
-        mu = mu / denom
-        fe = -(mu * (np.log(mu + 1e-12))).sum(axis=0)
-        score = float((fe * hist).sum())
-        return score
+        return float(fe_batch(np.asarray(x)[None, :])[0])
+
+    fe_score.batch = fe_batch
     return fe_score
 
+class CachedObjective:
+    """Memoize an objective on the integer threshold tuple it actually scores.
+
+    maxsize=None keeps every entry; otherwise the least recently used ones are dropped.
+    """
+    def __init__(self, obj, K, maxsize=None):
+        self.obj = obj
+        self.K = K
+        self.maxsize = maxsize
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        val = self.table.get(key)
+        if val is not None:
+            self.table.move_to_end(key)
+        return val
+
+    def _store(self, key, val):
+        self.table[key] = val
+        if self.maxsize is not None and len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+
+    def __call__(self, x):
+        T = sorted_thresholds(np.asarray(x), self.K)
+        key = tuple(T.tolist())
+        val = self._lookup(key)
+        if val is not None:
+            self.hits += 1
+            return val
+        self.misses += 1
+        val = float(self.obj(T))
+        self._store(key, val)
+        return val
+
+    def batch(self, X):
+        T = sorted_thresholds_batch(X, self.K)
+        out = np.empty(len(T), dtype=np.float64)
+        pending = {}
+        for i, key in enumerate(map(tuple, T.tolist())):
+            val = self._lookup(key)
+            if val is not None:
+                out[i] = val
+            elif key in pending:
+                pending[key].append(i)
+            else:
+                pending[key] = [i]
+                self.misses += 1
+                continue
+            self.hits += 1
+        if pending:
+            vals = evaluate_population(self.obj, np.array(list(pending), dtype=np.int32))
+            for (key, idx), val in zip(pending.items(), vals.tolist()):
+                out[idx] = val
+                self._store(key, val)
+        return out
+
+    @property
+    def evals(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.evals if self.evals else 0.0
+
+def _xlogx(m):
+    out = np.zeros_like(m)
+    np.multiply(m, np.log(m, out=out, where=m > 0), out=out, where=m > 0)
+    return out
+
+class IncrementalFuzzyEntropy:
+    """Fuzzy entropy of one current threshold vector, re-scored per moved threshold.
+
+    Keeps the per-bin membership sum D and sum(mu*log(mu)) G, so moving threshold j only
+    recomputes classes j and j+1 (two rows of 256 bins) whatever K is. Calling the object
+    on a vector diffs it against the current thresholds and moves to it (the state changes).
+    Meant for a chain of single moves (local_search); a population is scored faster by
+    fuzzy_entropy_batch.
+    """
+    def __init__(self, hist, K, s=2.0, x=None):
+        self.hist = np.asarray(hist, dtype=np.float64)
+        self.K = K
+        self.s = s
+        self.A, self.B = membership_tables(float(s))
+        self.reset(np.linspace(1, 254, K + 2)[1:-1] if x is None else x)
+
+    def _rows(self, T, classes):
+        rows = np.ones((len(classes), 256))
+        for r, c in enumerate(classes):
+            if c > 0:
+                rows[r] *= self.B[T[c-1]]
+            if c < self.K:
+                rows[r] *= self.A[T[c]]
+        return rows
+
+    def _entropy(self, D, G):
+        Dp = D + 1e-12
+        return (-G + D * np.log(Dp)) / Dp @ self.hist
+
+    def reset(self, x):
+        self.T = sorted_thresholds(np.asarray(x), self.K).copy()
+        self.mu = self._rows(self.T, range(self.K + 1))
+        self.mlogm = _xlogx(self.mu)
+        self.D = self.mu.sum(axis=0)
+        self.G = self.mlogm.sum(axis=0)
+        self.score = float(self._entropy(self.D, self.G))
+        self._updates = 0
+        return self.score
+
+    def _propose(self, T):
+        changed = np.flatnonzero(T != self.T).tolist()
+        classes = sorted({c for j in changed for c in (j, j + 1)})
+        rows = self._rows(T, classes)
+        mlogm = _xlogx(rows)
+        D = self.D + (rows - self.mu[classes]).sum(axis=0)
+        G = self.G + (mlogm - self.mlogm[classes]).sum(axis=0)
+        return float(self._entropy(D, G)), (T, classes, rows, mlogm, D, G)
+
+    def _commit(self, state):
+        T, classes, rows, mlogm, D, G = state
+        self.T = T
+        self.mu[classes] = rows
+        self.mlogm[classes] = mlogm
+        self.D, self.G = D, G
+        self._updates += 1
+        if self._updates >= 256:
+            # re-sum to drop the rounding drift of many small updates
+            self.D = self.mu.sum(axis=0)
+            self.G = self.mlogm.sum(axis=0)
+            self._updates = 0
+
+    def can_move(self, j, t):
+        lo = self.T[j-1] if j > 0 else 0
+        hi = self.T[j+1] if j + 1 < self.K else 255
+        return lo < t < hi
+
+    def _moved(self, j, t):
+        if not self.can_move(j, t):
+            raise ValueError("threshold %d cannot move to %d (neighbours %s)" % (j, t, self.T.tolist()))
+        T = self.T.copy()
+        T[j] = t
+        return T
+
+    def peek(self, j, t):
+        """Score with threshold j moved to t, without changing the current solution."""
+        return self._propose(self._moved(j, t))[0]
+
+    def move(self, j, t):
+        self.score, state = self._propose(self._moved(j, t))
+        self._commit(state)
+        return self.score
+
+    def try_move(self, j, t):
+        """Move threshold j to t only if that raises the score."""
+        score, state = self._propose(self._moved(j, t))
+        if score <= self.score:
+            return False
+        self.score = score
+        self._commit(state)
+        return True
+
+    def __call__(self, x):
+        self.score, state = self._propose(sorted_thresholds(np.asarray(x), self.K))
+        self._commit(state)
+        return self.score
+
+def evaluate_population(obj, X):
+    """Score every row of X, using obj.batch when the objective provides one."""
+    batch = getattr(obj, "batch", None)
+    if batch is not None:
+        return np.asarray(batch(X), dtype=np.float64)
+    return np.array([obj(x) for x in X], dtype=np.float64)
+
 def apply_thresholds(img_gray, T, s=2.0):
-    bins = np.arange(256, dtype=np.float32)
-    K = len(T)
-    Kp1 = K + 1
-    mu = np.zeros((Kp1, 256), dtype=np.float64)
-    mu[0] = 1.0 / (1.0 + np.exp(- (T[0] - bins) / s))
-    mu[K] = 1.0 / (1.0 + np.exp(- (bins - T[-1]) / s))
-    for j in range(1, K):
-        left = 1.0 / (1.0 + np.exp(- (bins - T[j-1]) / s))
-        right = 1.0 / (1.0 + np.exp(- (T[j] - bins) / s))
-        mu[j] = left * right
-    denom = mu.sum(axis=0, keepdims=True) + 1e-12
-    mu = mu / denom
-    lut = mu.argmax(axis=0).astype(np.uint8)
-    return lut[img_gray]
+    from .segmentation import apply_thresholds_to_image
+    return apply_thresholds_to_image(img_gray, T, mode='fuzzy', s=s)
@@ -1,37 +1,83 @@
 
+import threading
 import numpy as np
 
-def _one_hot(labels, num_classes):
-    h, w = labels.shape
-    oh = np.zeros((num_classes, h, w), dtype=np.uint8)
-    for c in range(num_classes):
-        oh[c] = (labels == c).astype(np.uint8)
-    return oh
-
-def dice_score(pred, gt, num_classes=None, eps=1e-7):
+def confusion_matrix(pred, gt, num_classes=None):
+    """Joint label histogram: cm[i, j] = #pixels with pred == i and gt == j (one bincount pass)."""
+    pred = np.asarray(pred).ravel()
+    gt = np.asarray(gt).ravel()
     if num_classes is None:
         num_classes = max(int(pred.max()), int(gt.max())) + 1
-    P = _one_hot(pred, num_classes)
-    G = _one_hot(gt, num_classes)
-    dice_c = []
-    for c in range(num_classes):
-        inter = (P[c] & G[c]).sum()
-        denom = P[c].sum() + G[c].sum()
-        dice_c.append((2.0 * inter + eps) / (denom + eps))
-    return float(np.mean(dice_c)), dice_c
+    n = int(num_classes)
+    idx = pred.astype(np.int64) * n
+    idx += gt
+    return np.bincount(idx, minlength=n * n)[:n * n].reshape(n, n)
 
-def iou_score(pred, gt, num_classes=None, eps=1e-7):
+def _classes(cm, num_classes=None):
+    # như khi tính trên ảnh: số lớp = nhãn lớn nhất có mặt trong pred hoặc gt + 1
     if num_classes is None:
-        num_classes = max(int(pred.max()), int(gt.max())) + 1
-    P = _one_hot(pred, num_classes)
-    G = _one_hot(gt, num_classes)
-    iou_c = []
-    for c in range(num_classes):
-        inter = (P[c] & G[c]).sum()
-        union = P[c].sum() + G[c].sum() - inter
-        iou_c.append((inter + eps) / (union + eps))
+        present = np.flatnonzero(cm.sum(axis=1) + cm.sum(axis=0))
+        num_classes = int(present[-1]) + 1 if len(present) else 1
+    n = int(num_classes)
+    out = np.zeros((n, n), dtype=cm.dtype)
+    m = min(n, cm.shape[0])
+    out[:m, :m] = cm[:m, :m]
+    return out
+
+def permute_confusion(cm, perm):
+    """Confusion matrix of np.take(perm, pred) from the one of pred (rows relabelled)."""
+    out = np.zeros_like(cm)
+    np.add.at(out, np.asarray(perm)[:cm.shape[0]], cm)
+    return out
+
+def dice_from_confusion(cm, num_classes=None, eps=1e-7):
+    cm = _classes(cm, num_classes)
+    inter = np.diag(cm).astype(np.float64)
+    denom = cm.sum(axis=1) + cm.sum(axis=0)
+    dice_c = list((2.0 * inter + eps) / (denom + eps))
+    return float(np.mean(dice_c)), dice_c
+
+def iou_from_confusion(cm, num_classes=None, eps=1e-7):
+    cm = _classes(cm, num_classes)
+    inter = np.diag(cm).astype(np.float64)
+    union = cm.sum(axis=1) + cm.sum(axis=0) - inter
+    iou_c = list((inter + eps) / (union + eps))
     return float(np.mean(iou_c)), iou_c
 
+def accuracy_from_confusion(cm):
+    return float(np.trace(cm) / max(1, cm.sum()))
+
+def hungarian_cost(cm):
+    """1 - IoU between every (pred label, gt label) pair."""
+    cm = cm.astype(np.float64)
+    inter = cm
+    union = cm.sum(axis=1)[:, None] + cm.sum(axis=0)[None, :] - inter
+    return 1.0 - inter / (union + 1e-9)
+
+def psnr_from_confusion(cm, pred_levels, gt_levels, max_val=255.0, eps=1e-7):
+    """PSNR between label maps rendered as pred_levels[pred] and gt_levels[gt]."""
+    a = np.asarray(pred_levels, dtype=np.float64)[:cm.shape[0], None]
+    b = np.asarray(gt_levels, dtype=np.float64)[None, :cm.shape[1]]
+    mse = float((cm * (a - b) ** 2).sum() / max(1, cm.sum()))
+    if mse <= 1e-20:
+        return 99.0
+    return 20.0 * np.log10(max_val) - 10.0 * np.log10(mse + eps)
+
+def label_levels(counts):
+    """Gray levels label*(255//(max_label+1)) used to render a label map, from its label counts."""
+    present = np.flatnonzero(counts)
+    top = int(present[-1]) if len(present) else 0
+    return np.arange(len(counts)) * (255 // (top + 1))
+
+def dice_score(pred, gt, num_classes=None, eps=1e-7):
+    return dice_from_confusion(confusion_matrix(pred, gt, num_classes), num_classes, eps)
+
+def iou_score(pred, gt, num_classes=None, eps=1e-7):
+    return iou_from_confusion(confusion_matrix(pred, gt, num_classes), num_classes, eps)
+
+def pixel_accuracy(pred, gt):
+    return accuracy_from_confusion(confusion_matrix(pred, gt))
+
 def psnr(img, ref, max_val=255.0, eps=1e-7):
     img = img.astype(np.float32)
     ref = ref.astype(np.float32)
@@ -40,9 +86,136 @@ def psnr(img, ref, max_val=255.0, eps=1e-7):
         return 99.0
     return 20.0 * np.log10(max_val) - 10.0 * np.log10(mse + eps)
 
+# Bộ đệm dùng lại giữa các ảnh cùng kích thước (mỗi luồng một bộ), khoá theo (tên, shape, dtype)
+_SCRATCH = threading.local()
+
+def _scratch(name, shape, dtype):
+    bufs = getattr(_SCRATCH, "bufs", None)
+    if bufs is None:
+        bufs = _SCRATCH.bufs = {}
+    key = (name, tuple(shape), np.dtype(dtype))
+    buf = bufs.get(key)
+    if buf is None:
+        if len(bufs) > 64:
+            bufs.clear()
+        buf = bufs[key] = np.empty(shape, dtype)
+    return buf
+
+def _take(a, axis, start, n):
+    idx = [slice(None)] * a.ndim
+    idx[axis] = slice(start, start + n)
+    return a[tuple(idx)]
+
+def _box_sum(x, win, axis, out):
+    """out[i] = x[i] + ... + x[i+win-1] along axis, from power-of-two partial sums (no cumsum)."""
+    n = out.shape[axis]
+    p, k, off, first = x, 1, 0, True   # p[i] = tổng k phần tử x[i:i+k]
+    while True:
+        if win & k:
+            if first:
+                np.copyto(out, _take(p, axis, off, n))
+                first = False
+            else:
+                np.add(out, _take(p, axis, off, n), out=out)
+            off += k
+        if 2 * k > win:
+            return out
+        shape = list(p.shape)
+        shape[axis] -= k
+        q = _scratch(f"box{axis}_{k}", shape, x.dtype)
+        np.add(_take(p, axis, 0, shape[axis]), _take(p, axis, k, shape[axis]), out=q)
+        p, k = q, 2 * k
+
+def _reflect_pad(src, lo, hi, out):
+    """np.pad(src, ((lo, hi), (lo, hi)), 'symmetric') written into out (= scipy mode='reflect')."""
+    H, W = src.shape
+    if max(lo, hi) > min(H, W):
+        out[...] = np.pad(src, ((lo, hi), (lo, hi)), mode="symmetric")
+        return out
+    out[lo:lo + H, lo:lo + W] = src
+    out[lo:lo + H, :lo] = src[:, :lo][:, ::-1]
+    out[lo:lo + H, lo + W:] = src[:, W - hi:][:, ::-1]
+    out[:lo] = out[lo:2 * lo][::-1]
+    out[lo + H:] = out[lo + H - hi:lo + H][::-1]
+    return out
+
+def _ssim_mean(x, y, win, sx, sy, K, top, band=64):
+    """Mean SSIM of (sx*x, sy*y) for int maps x, y in [0, top], from exact integer window sums.
+
+    The five moment maps are box-summed by rows then columns and turned into SSIM one band of
+    output rows at a time, so the temporaries stay small (and cache-resident) for any image size.
+    """
+    H, W = x.shape
+    lo, hi = win // 2, win - 1 - win // 2
+    n = win * win
+    # mọi tổng riêng phần <= n*top² -> uint16 khi đủ (nhãn nhỏ), không thì uint32
+    acc = np.uint16 if n * top * top < 2 ** 16 else np.uint32
+    # bước sau cần n*Σx² và (Σx)², cả hai <= (n*top)²
+    idt = np.int32 if (n * top) ** 2 < 2 ** 31 else np.int64
+    M = _scratch("ssim_m", (5, H + win - 1, W + win - 1), acc)
+    _reflect_pad(x, lo, hi, M[0])
+    _reflect_pad(y, lo, hi, M[1])
+    np.multiply(M[0], M[0], out=M[2])
+    np.multiply(M[1], M[1], out=M[3])
+    np.multiply(M[0], M[1], out=M[4])
+    L = 255.0
+    C1 = (K[0] * L) ** 2 * n * n
+    C2 = (K[1] * L) ** 2 * n * n
+    f32 = dict(dtype=np.float32)
+    total = 0.0
+    for r0 in range(0, H, band):
+        h = min(band, H - r0)
+        R = _box_sum(M[:, r0:r0 + h + win - 1], win, 2, _scratch("ssim_r", (5, h + win - 1, W), acc))
+        S = _box_sum(R, win, 1, _scratch("ssim_s", (5, h, W), acc))
+        a, b, aa, bb, ab = I = _scratch("ssim_i", (5, h, W), idt)
+        np.copyto(I, S)
+        P, Qa, Qb = (_scratch(f"ssim_q{i}", (h, W), idt) for i in range(3))
+        np.multiply(a, b, out=P)                    # n²·mu1·mu2
+        np.multiply(ab, n, out=ab); ab -= P         # n²·sigma12
+        np.multiply(a, a, out=Qa)                   # n²·mu1²
+        np.multiply(b, b, out=Qb)
+        np.multiply(aa, n, out=aa); aa -= Qa        # n²·sigma1²
+        np.multiply(bb, n, out=bb); bb -= Qb
+        F0, F1, F2, F3 = (_scratch(f"ssim_f{i}", (h, W), np.float32) for i in range(4))
+        np.multiply(P, 2.0 * sx * sy, out=F0, **f32); F0 += C1
+        np.multiply(ab, 2.0 * sx * sy, out=F1, **f32); F1 += C2
+        F0 *= F1
+        np.multiply(aa, sx * sx, out=F1, **f32); np.multiply(bb, sy * sy, out=F2, **f32); F1 += F2; F1 += C2
+        np.multiply(Qa, sx * sx, out=F2, **f32); np.multiply(Qb, sy * sy, out=F3, **f32); F2 += F3; F2 += C1
+        F1 *= F2
+        F1 += 1e-7 * n ** 4                         # epsilon của công thức gốc, cũng nhân n⁴
+        F0 /= F1
+        total += float(F0.sum(dtype=np.float64))
+    return total / (H * W)
+
+def _int_range(a):
+    a = np.asarray(a)
+    if a.dtype.kind not in "uib":
+        return None
+    lo, hi = (int(a.min()), int(a.max())) if a.size else (0, 0)
+    return (lo, hi) if lo >= 0 else None
+
 def ssim(img, ref, K=(0.01, 0.03), win_size=11):
+    """Mean SSIM with a win_size box window (uniform_filter, mode='reflect').
+
+    Integer images in [0, 255] use exact integer window sums (no scipy); others go through scipy.
+    """
+    ri, rr = _int_range(img), _int_range(ref)
+    if ri is None or rr is None or max(ri[1], rr[1]) > 255 or np.shape(img) != np.shape(ref) or np.ndim(img) != 2:
+        return _ssim_float(img, ref, K, win_size)
+    return _ssim_mean(np.asarray(img), np.asarray(ref), win_size, 1.0, 1.0, K, max(ri[1], rr[1]))
+
+def ssim_labels(pred, gt, K=(0.01, 0.03), win_size=11):
+    """ssim of two label maps rendered as label*(255//(max_label+1)), without building the renders."""
+    pred = np.asarray(pred)
+    gt = np.asarray(gt)
+    mp, mg = int(pred.max()), int(gt.max())
+    if min(int(pred.min()), int(gt.min())) < 0 or max(mp, mg) > 255:
+        return ssim(pred * (255 // (mp + 1)), gt * (255 // (mg + 1)), K, win_size)
+    return _ssim_mean(pred, gt, win_size, float(255 // (mp + 1)), float(255 // (mg + 1)), K, max(mp, mg))
+
+def _ssim_float(img, ref, K=(0.01, 0.03), win_size=11):
     # Simplified SSIM using uniform filter (requires scipy)
-    import numpy as np
     from scipy.ndimage import uniform_filter
     L = 255.0
     K1, K2 = K
@@ -0,0 +1,270 @@
+import os, csv, json, glob, numpy as np
+
+# Kết quả dạng cột: một thư mục gồm các phần part-00000.parquet (khi có pyarrow) hoặc part-00000.npz,
+# mỗi phần là một khối dòng. Ngưỡng lưu thành mảng int16 (values + offsets), không phải chuỗi.
+# iter_chunks đọc cả thư mục này lẫn metrics_*.csv (kèm timing_*.csv) theo từng khối,
+# Pivot xoay chúng trong một lượt đọc thành mảng dày (ảnh × algo × K × run), không giữ từng dòng;
+# bảng tổng hợp (mean/std) và các kiểm định thống kê (src/stats.py) cùng dùng mảng này.
+
+FIELDS = ["image", "algo", "K", "run", "FE", "Dice", "IoU", "PSNR", "SSIM", "thresholds",
+          "FE_opt", "gap", "Acc", "evals", "stop", "sec"]
+STR_FIELDS = ("image", "algo", "stop")
+INT_FIELDS = {"K": np.int16, "run": np.int32, "evals": np.int64}
+METRICS = ("Dice", "IoU", "FE", "PSNR", "SSIM", "Acc", "sec")
+
+def _have_pyarrow():
+    try:
+        import pyarrow, pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def resolve_format(fmt="auto"):
+    if fmt == "auto":
+        return "parquet" if _have_pyarrow() else "npz"
+    if fmt not in ("parquet", "npz"):
+        raise ValueError("store format must be 'auto', 'parquet' or 'npz'")
+    if fmt == "parquet" and not _have_pyarrow():
+        raise ImportError("Parquet output needs pyarrow (pip install pyarrow) or use --store npz")
+    return fmt
+
+def _float(v):
+    return np.nan if v is None or v == "" else float(v)
+
+def _thresholds(v):
+    return json.loads(v) if isinstance(v, str) else ([] if v is None else list(v))
+
+def columns_from_rows(rows, fields=None):
+    """Typed column arrays from rows in FIELDS order (python values or CSV strings; None/'' -> NaN/-1/'').
+
+    fields: only build these columns ("thresholds" gives thr_values/thr_offsets).
+    """
+    cols = {}
+    for j, name in enumerate(FIELDS):
+        if fields is not None and name not in fields:
+            continue
+        vals = [r[j] for r in rows]
+        if name in STR_FIELDS:
+            cols[name] = np.array(["" if v is None else str(v) for v in vals], dtype=str)
+        elif name in INT_FIELDS:
+            cols[name] = np.array([-1 if v is None or v == "" else int(v) for v in vals], dtype=INT_FIELDS[name])
+        elif name == "thresholds":
+            T = [_thresholds(v) for v in vals]
+            cols["thr_offsets"] = np.concatenate([[0], np.cumsum([len(t) for t in T])]).astype(np.int64)
+            cols["thr_values"] = np.array([x for t in T for x in t], dtype=np.int16)
+        else:
+            cols[name] = np.array([_float(v) for v in vals], dtype=np.float64)
+    return cols
+
+def _write_part(path, cols, fmt):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if fmt == "parquet":
+        import pyarrow as pa, pyarrow.parquet as pq
+        data = {k: v for k, v in cols.items() if not k.startswith("thr_")}
+        data["thresholds"] = pa.ListArray.from_arrays(pa.array(cols["thr_offsets"].astype(np.int32)),
+                                                      pa.array(cols["thr_values"]))
+        pq.write_table(pa.table(data), tmp)
+    else:
+        with open(tmp, "wb") as f:
+            np.savez(f, **cols)
+    os.replace(tmp, path)
+
+def _parts(path):
+    return sorted(glob.glob(os.path.join(path, "part-*.parquet")) + glob.glob(os.path.join(path, "part-*.npz")))
+
+class ResultsWriter:
+    """Appends result rows (FIELDS order) to a columnar store, one part file per chunk_rows rows."""
+    def __init__(self, path, fmt="auto", chunk_rows=65536):
+        self.path = str(path)
+        self.fmt = resolve_format(fmt)
+        self.chunk_rows = max(1, int(chunk_rows))
+        os.makedirs(self.path, exist_ok=True)
+        self._part = len(_parts(self.path))
+        self._rows = []
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        ext = "parquet" if self.fmt == "parquet" else "npz"
+        _write_part(os.path.join(self.path, f"part-{self._part:05d}.{ext}"), columns_from_rows(self._rows), self.fmt)
+        self._part += 1
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _read_part(path, columns):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(columns=columns):
+            out = {}
+            for name, col in zip(batch.schema.names, batch.columns):
+                if name == "thresholds":
+                    out["thr_offsets"] = col.offsets.to_numpy().astype(np.int64)
+                    out["thr_values"] = col.values.to_numpy(zero_copy_only=False).astype(np.int16)
+                elif name in STR_FIELDS:
+                    out[name] = col.to_numpy(zero_copy_only=False).astype(str)
+                else:
+                    out[name] = col.to_numpy(zero_copy_only=False)
+            yield out
+    else:
+        with np.load(path) as z:
+            names = z.files if columns is None else [c for c in z.files
+                                                     if c in columns or (c.startswith("thr_") and "thresholds" in columns)]
+            yield {c: z[c] for c in names}
+
+def _iter_csv(path, columns, chunk_rows):
+    # metrics_*.csv + timing_*.csv cùng tên (cột sec); hai file được ghi song song nên thường khớp từng dòng
+    head, base = os.path.split(path)
+    tpath = os.path.join(head, base.replace("metrics_", "timing_", 1))
+    tf = open(tpath, newline="") if base.startswith("metrics_") and os.path.exists(tpath) else None
+    treader = csv.reader(tf) if tf is not None else iter(())
+    next(treader, None)
+    pending = {}
+    def sec_of(key):
+        while key not in pending:
+            r = next(treader, None)
+            if r is None:
+                return None
+            if len(r) == 5:
+                pending[tuple(r[:4])] = r[4]
+        return pending.pop(key)
+    try:
+        with open(path, newline="") as f:
+            rd = csv.reader(f)
+            header = next(rd, None) or []
+            idx = [header.index(k) if k in header else None for k in FIELDS[:-1]]
+            want_sec = columns is None or "sec" in columns
+            rows = []
+            for r in rd:
+                if len(r) != len(header):
+                    continue
+                row = [r[j] if j is not None else None for j in idx]
+                row.append(sec_of(tuple(row[:4])) if tf is not None and want_sec else None)
+                rows.append(row)
+                if len(rows) >= chunk_rows:
+                    yield columns_from_rows(rows, columns)
+                    rows = []
+            if rows:
+                yield columns_from_rows(rows, columns)
+    finally:
+        if tf is not None:
+            tf.close()
+
+def iter_chunks(path, columns=None, chunk_rows=65536):
+    """Column dicts (numpy arrays), chunk by chunk, from a store directory or a metrics CSV."""
+    if os.path.isdir(path):
+        for part in _parts(path):
+            yield from _read_part(part, columns)
+    else:
+        yield from _iter_csv(path, columns, chunk_rows)
+
+def store_from_csv(csv_path, path, fmt="auto", chunk_rows=65536):
+    """(Re)build a store directory from a metrics CSV (+ timing sidecar)."""
+    os.makedirs(path, exist_ok=True)
+    for part in _parts(path):
+        os.remove(part)
+    fmt = resolve_format(fmt)
+    n = 0
+    for i, cols in enumerate(iter_chunks(csv_path, chunk_rows=chunk_rows)):
+        ext = "parquet" if fmt == "parquet" else "npz"
+        _write_part(os.path.join(path, f"part-{i:05d}.{ext}"), cols, fmt)
+        n += len(cols["image"])
+    return n
+
+class Pivot:
+    """Dense (image, algo, K, run) arrays of each metric, NaN where a cell is missing.
+
+    Filled chunk by chunk (update/consume); summary() gives the per-(algo, K) table and
+    mean_runs() the per-image means the paired tests in src/stats.py work on.
+    """
+    def __init__(self, metrics=("Dice", "IoU", "FE")):
+        self.metrics = list(metrics)
+        self.images, self.algos, self.Ks, self.runs = [], [], [], []
+        self._ids = ({}, {}, {}, {})
+        self.data = {m: np.full((0, 0, 0, 0), np.nan) for m in self.metrics}
+        self.groups = set()                   # (chỉ số algo, chỉ số K) đã có ít nhất một dòng
+        self.rows = 0
+
+    def _index(self, ax, values):
+        uniq, inv = np.unique(values, return_inverse=True)
+        ids, names = self._ids[ax], (self.images, self.algos, self.Ks, self.runs)[ax]
+        gid = np.empty(len(uniq), np.int64)
+        for i, u in enumerate(uniq.tolist()):
+            if u not in ids:
+                ids[u] = len(names)
+                names.append(u)
+            gid[i] = ids[u]
+        return gid[inv.ravel()]
+
+    def _grow(self):
+        # trục ảnh tăng gấp đôi khi thiếu chỗ; các trục nhỏ (algo/K/run) vừa đúng kích thước
+        n, rest = len(self.images), (len(self.algos), len(self.Ks), len(self.runs))
+        for m, old in self.data.items():
+            if old.shape[0] < n or old.shape[1:] != rest:
+                new = np.full((max(n, 2 * old.shape[0]),) + rest, np.nan)
+                new[:old.shape[0], :old.shape[1], :old.shape[2], :old.shape[3]] = old
+                self.data[m] = new
+
+    def update(self, cols):
+        if len(cols["algo"]) == 0:
+            return self
+        self.rows += len(cols["algo"])
+        idx = (self._index(0, cols["image"]), self._index(1, cols["algo"]),
+               self._index(2, cols["K"].astype(np.int64)), self._index(3, cols["run"].astype(np.int64)))
+        self._grow()
+        self.groups.update(map(tuple, np.unique(np.stack(idx[1:3], axis=1), axis=0).tolist()))
+        for m in self.metrics:
+            if m in cols:
+                self.data[m][idx] = cols[m]
+        return self
+
+    def consume(self, chunks):
+        for cols in chunks:
+            self.update(cols)
+        return self
+
+    def array(self, metric):
+        """(image, algo, K, run) view of metric."""
+        return self.data[metric][:len(self.images)]
+
+    def mean_runs(self, metric):
+        """(image, algo, K) mean over runs, NaN when no run has a value."""
+        A = self.array(metric)
+        ok = ~np.isnan(A)
+        c = ok.sum(-1)
+        out = np.full(c.shape, np.nan)
+        np.divide(np.where(ok, A, 0.0).sum(-1), c, out=out, where=c > 0)
+        return out
+
+    def summary(self):
+        """[(algo, K, {metric: (n, mean, std)})] sorted by algo then K; std has ddof=0, NaNs skipped."""
+        res = {g: {} for g in self.groups}
+        for m in self.metrics:
+            A = self.array(m)
+            ok = ~np.isnan(A)
+            n = ok.sum(axis=(0, 3))
+            x = np.where(ok, A, 0.0)
+            mean = np.divide(x.sum(axis=(0, 3)), n, out=np.full(n.shape, np.nan), where=n > 0)
+            d2 = np.where(ok, (A - mean[None, :, :, None]) ** 2, 0.0).sum(axis=(0, 3))
+            std = np.sqrt(np.divide(d2, n, out=np.full(n.shape, np.nan), where=n > 0))
+            for a, k in self.groups:
+                res[(a, k)][m] = (int(n[a, k]), float(mean[a, k]), float(std[a, k]))
+        return sorted((self.algos[a], int(self.Ks[k]), st) for (a, k), st in res.items())
+
+def aggregate(path, metrics=METRICS, chunk_rows=65536):
+    """Pivot over every chunk of a store directory or metrics CSV, in one pass."""
+    cols = ["image", "algo", "K", "run"] + list(metrics)
+    return Pivot(metrics).consume(iter_chunks(path, cols, chunk_rows))
@@ -1,16 +1,31 @@
 
 import numpy as np
-from .fuzzy_entropy import apply_thresholds
+from functools import lru_cache
+from .fuzzy_entropy import memberships
 
-def apply_thresholds_to_image(img_gray, T, mode='fuzzy', s=2.0):
+@lru_cache(maxsize=256)
+def _threshold_lut(T, mode, s):
     if mode == 'fuzzy':
-        return apply_thresholds(img_gray, T, s=s)
+        # nhãn = lớp có membership lớn nhất tại mỗi mức xám
+        lut = memberships(np.asarray(T)[None, :], s)[0].argmax(0)
     else:
-        K = len(T)
-        seg = np.zeros_like(img_gray, dtype=np.uint8)
-        prev = -1
-        for k, t in enumerate(T):
-            seg[(img_gray > prev) & (img_gray <= t)] = k
-            prev = t
-        seg[img_gray > prev] = K
-        return seg
+        # lớp k = (t_{k-1}, t_k] -> số ngưỡng nhỏ hơn hẳn mức xám
+        lut = np.searchsorted(np.sort(np.asarray(T)), np.arange(256), side='left')
+    lut = lut.astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+def threshold_lut(T, mode='fuzzy', s=2.0):
+    """Cached 256-entry uint8 label table for thresholds T ('fuzzy' or hard mode)."""
+    return _threshold_lut(tuple(np.asarray(T).ravel().tolist()), mode, float(s))
+
+def apply_thresholds_to_image(img_gray, T, mode='fuzzy', s=2.0, out=None):
+    """Label map lut[img] for a uint8 image, an (N, H, W) stack or a list of images.
+
+    out: optional uint8 buffer (a list of buffers for a list of images) written in place.
+    """
+    lut = threshold_lut(T, mode, s)
+    if isinstance(img_gray, (list, tuple)):
+        outs = out if out is not None else [None] * len(img_gray)
+        return [np.take(lut, im, mode='clip', out=o) for im, o in zip(img_gray, outs)]
+    return np.take(lut, img_gray, mode='clip', out=out)
@@ -0,0 +1,180 @@
+import numpy as np
+from functools import lru_cache
+
+# Kiểm định ý nghĩa thống kê trên kết quả đã xoay một lần thành mảng dày (ảnh × algo × K × run, results_store.Pivot).
+# Mọi tổ hợp (metric, K, baseline) được kiểm định cùng lúc trên mảng, không quét lại danh sách dòng.
+
+def _rank(a):
+    """Average ranks along the last axis and the size of each element's tie group."""
+    from scipy.stats import rankdata
+    lo, hi = rankdata(a, "min", axis=-1), rankdata(a, "max", axis=-1)
+    return (lo + hi) / 2, hi - lo + 1
+
+@lru_cache(maxsize=64)
+def _signrank_sf(n):
+    # P(W+ >= w), w = 0..n(n+1)/2, dưới H0 khi không có ties (đếm tập con của {1..n} theo tổng)
+    c = np.zeros(n * (n + 1) // 2 + 1)
+    c[0] = 1.0
+    for k in range(1, n + 1):
+        c[k:] = c[k:] + c[:-k].copy()
+    sf = np.cumsum(c[::-1])[::-1] / 2.0 ** n
+    sf.setflags(write=False)
+    return sf
+
+def wilcoxon(x, y):
+    """One-sided (x > y) Wilcoxon signed-rank test along the last axis, vectorized over the others.
+
+    NaN pairs are skipped and zero differences dropped (zero_method='wilcox'); p is 1 when every
+    difference is zero and NaN without pairs. Like scipy's
+    wilcoxon(..., alternative='greater'): exact p for n <= 50 without ties or zeros, all sign flips
+    for other samples of at most 13 pairs, otherwise the normal approximation. Returns (n, W+, p).
+    """
+    from scipy.stats import norm
+    d = np.asarray(x, dtype=np.float64) - np.asarray(y, dtype=np.float64)
+    ok = ~np.isnan(d) & (d != 0)
+    n = ok.sum(-1)
+    r, t = _rank(np.where(ok, np.abs(d), np.inf))
+    r = np.where(ok, r, 0.0)
+    W = np.where(d > 0, r, 0.0).sum(-1)
+    ties = np.where(ok, t * t - 1, 0.0).sum(-1)          # = Σ (t³ − t) theo từng nhóm ties
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (W - n * (n + 1) / 4) / np.sqrt((n * (n + 1) * (2 * n + 1) - ties / 2) / 24)
+    p = np.asarray(norm.sf(z), dtype=np.float64)
+    total = (~np.isnan(d)).sum(-1)
+    exact = (ties == 0) & (total == n) & (n > 0) & (n <= 50)
+    for k in np.unique(n[exact]).tolist():
+        sel = exact & (n == k)
+        p[sel] = _signrank_sf(k)[np.floor(W[sel]).astype(np.int64)]
+    perm = ~exact & (n > 0) & (total <= 13)
+    for i in map(tuple, np.argwhere(perm)):
+        rv = r[i][ok[i]]
+        flips = (np.arange(2 ** len(rv))[:, None] >> np.arange(len(rv))) & 1
+        p[i] = np.mean(flips @ rv >= W[i] * (1 - 1e-14))
+    p[n == 0] = 1.0                                      # toàn bộ chênh lệch bằng 0: không có bằng chứng
+    p[total == 0] = np.nan
+    return n, W, p
+
+def sign_test(x, y):
+    """One-sided (x > y) sign test along the last axis; ties and NaN pairs dropped. Returns (n+, n-, p)."""
+    from scipy.stats import binom
+    d = np.asarray(x, dtype=np.float64) - np.asarray(y, dtype=np.float64)
+    pos, neg = (d > 0).sum(-1), (d < 0).sum(-1)
+    p = np.asarray(binom.sf(pos - 1, pos + neg, 0.5), dtype=np.float64)
+    p[(~np.isnan(d)).sum(-1) == 0] = np.nan
+    return pos, neg, p
+
+def bootstrap_ci(d, n_boot=2000, alpha=0.05, seed=0):
+    """Mean of d along the last axis (NaN skipped) with a percentile bootstrap CI. Returns (mean, lo, hi).
+
+    Series of the same length share one set of resamples, held as a (n_boot, n) count matrix, so
+    all their bootstrap means come from a single matrix product.
+    """
+    d = np.asarray(d, dtype=np.float64)
+    shape, N = d.shape[:-1], d.shape[-1]
+    D = d.reshape(-1, N)
+    ok = ~np.isnan(D)
+    n = ok.sum(1)
+    V = np.take_along_axis(D, np.argsort(~ok, axis=1, kind="stable"), 1)   # giá trị hợp lệ dồn lên đầu
+    u = np.random.default_rng(seed).random((n_boot, N))
+    mean = np.full(len(D), np.nan)
+    lo, hi = mean.copy(), mean.copy()
+    for k in np.unique(n[n > 0]).tolist():
+        c = np.nonzero(n == k)[0]
+        idx = (u[:, :k] * k).astype(np.int64) + np.arange(n_boot)[:, None] * k
+        counts = np.bincount(idx.ravel(), minlength=n_boot * k).reshape(n_boot, k).astype(np.float64)
+        means = V[c, :k] @ counts.T / k                                     # (series, n_boot)
+        mean[c] = V[c, :k].mean(1)
+        lo[c], hi[c] = np.quantile(means, [alpha / 2, 1 - alpha / 2], axis=1)
+    return mean.reshape(shape), lo.reshape(shape), hi.reshape(shape)
+
+def friedman(Y):
+    """Friedman test over blocks (axis -2) × treatments (axis -1), vectorized over leading axes.
+
+    Blocks with any NaN are dropped; rank 1 = largest value. Returns (n, chi2, p, mean_ranks).
+    """
+    from scipy.stats import chi2 as chi2_dist
+    Y = np.asarray(Y, dtype=np.float64)
+    k = Y.shape[-1]
+    ok = ~np.isnan(Y).any(-1)
+    n = ok.sum(-1)
+    R, t = _rank(-np.where(np.isnan(Y), 0.0, Y))
+    Rsum = np.where(ok[..., None], R, 0.0).sum(-2)
+    ties = np.where(ok[..., None], t * t - 1, 0.0).sum((-2, -1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        c = 1 - ties / (k * (k * k - 1) * n)
+        chi2 = (12.0 / (n * k * (k + 1)) * (Rsum ** 2).sum(-1) - 3 * n * (k + 1)) / c
+        ranks = Rsum / n[..., None]
+    p = np.asarray(chi2_dist.sf(chi2, k - 1), dtype=np.float64)
+    bad = (n < 2) | (c <= 0)
+    chi2, p = np.where(bad, np.nan, chi2), np.where(bad, np.nan, p)
+    return n, chi2, p, ranks
+
+def nemenyi_cd(k, n, alpha=0.05):
+    """Nemenyi critical difference of mean ranks for k treatments over n blocks."""
+    from scipy.stats import studentized_range
+    q = studentized_range.ppf(1 - alpha, k, np.inf) / np.sqrt(2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return q * np.sqrt(k * (k + 1) / (6.0 * np.asarray(n, dtype=np.float64)))
+
+def compare_to(pv, ref="mfwoa", baselines=None, metrics=None, min_pairs=5, n_boot=2000, seed=0):
+    """ref vs each baseline, per (metric, K), paired by image (means over runs).
+
+    Rows [metric, K, baseline, n_pairs, W, p, sign+, sign-, sign_p, mean_diff, ci_low, ci_high],
+    only for combinations with at least min_pairs paired images.
+    """
+    if ref not in pv.algos:
+        return []
+    metrics = pv.metrics if metrics is None else list(metrics)
+    base = [b for b in (pv.algos if baselines is None else baselines) if b != ref and b in pv.algos]
+    if not base:
+        return []
+    a0, ab = pv.algos.index(ref), [pv.algos.index(b) for b in base]
+    kord = np.argsort(pv.Ks)
+    M = np.stack([pv.mean_runs(m)[:, :, kord] for m in metrics])         # (metric, image, algo, K)
+    X = M[:, :, a0, :][:, :, None, :]                                    # (metric, image, 1, K)
+    Y = M[:, :, ab, :]                                                    # (metric, image, base, K)
+    X, Y = np.broadcast_arrays(X, Y)
+    X, Y = np.moveaxis(X, 1, -1), np.moveaxis(Y, 1, -1)                 # (metric, base, K, image)
+    pairs = (~np.isnan(X - Y)).sum(-1)
+    _, W, p = wilcoxon(X, Y)
+    pos, neg, sp = sign_test(X, Y)
+    mean, lo, hi = bootstrap_ci(X - Y, n_boot=n_boot, seed=seed)
+    rows = []
+    for mi, m in enumerate(metrics):
+        for kj, K in enumerate(np.asarray(pv.Ks)[kord].tolist()):
+            for bi, b in enumerate(base):
+                i = (mi, bi, kj)
+                if pairs[i] >= min_pairs:
+                    rows.append([m.lower(), int(K), b, int(pairs[i]), float(W[i]), float(p[i]),
+                                 int(pos[i]), int(neg[i]), float(sp[i]), float(mean[i]), float(lo[i]), float(hi[i])])
+    return rows
+
+def rank_tests(pv, algos=None, metrics=None, alpha=0.05):
+    """Friedman test + Nemenyi CD over algos per (metric, K), blocks = images with every ranked algo present.
+
+    Algos with no value at all for a metric (otsu has no FE) are left out of that metric's ranking,
+    so its rows cover the remaining algos. Rows [metric, K, algo, mean_rank, n_images, chi2, p, cd,
+    worse_than_best]; worse_than_best is 1 when the algo's mean rank exceeds the best one by more
+    than the critical difference.
+    """
+    metrics = pv.metrics if metrics is None else list(metrics)
+    names = [a for a in (pv.algos if algos is None else algos) if a in pv.algos]
+    aj = [pv.algos.index(a) for a in names]
+    kord = np.argsort(pv.Ks)
+    Ks = np.asarray(pv.Ks)[kord].tolist()
+    rows = []
+    for m in metrics:
+        M = pv.mean_runs(m)[:, aj][:, :, kord]                           # (image, algo, K)
+        keep = [j for j in range(len(names)) if not np.isnan(M[:, j]).all()]
+        if len(keep) < 2:
+            continue
+        n, chi2, p, ranks = friedman(np.moveaxis(M[:, keep], 2, 0))     # theo K: (K, image, algo)
+        cd = nemenyi_cd(len(keep), n, alpha)
+        for kj, K in enumerate(Ks):
+            if n[kj] < 2:
+                continue
+            best = ranks[kj].min()
+            for j, rk in zip(keep, ranks[kj].tolist()):
+                rows.append([m.lower(), int(K), names[j], rk, int(n[kj]), float(chi2[kj]), float(p[kj]),
+                             float(cd[kj]), int(rk - best > cd[kj])])
+    return rows
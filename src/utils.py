@@ -1,5 +1,6 @@
 
 import os, json, random, numpy as np
+from functools import lru_cache
 from pathlib import Path
 
 def set_seed(seed: int):
@@ -14,42 +15,151 @@ def save_gray(path, arr):
     arr = np.clip(arr, 0, 255).astype('uint8')
     Image.fromarray(arr, mode='L').save(path)
 
-def overlay_mask(img_gray, seg, alpha=0.5):
-    """Simple overlay: normalize seg labels to 0..255 per class hue mapping."""
-    import numpy as np, colorsys
-    h, w = img_gray.shape
-    num_classes = int(seg.max()) + 1
+def class_colors(num_classes):
+    """RGB colour per label: hues spread evenly around the HSV circle."""
+    import colorsys
     colors = []
     for i in range(num_classes):
         hue = i / max(1, num_classes)
         rgb = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
         colors.append((int(255*rgb[0]), int(255*rgb[1]), int(255*rgb[2])))
-    rgb_img = np.stack([img_gray]*3, axis=-1).astype(np.float32)
-    color_mask = np.zeros_like(rgb_img)
-    for c in range(num_classes):
-        mask = (seg == c)
-        color_mask[mask] = colors[c]
-    out = (1 - alpha) * rgb_img + alpha * color_mask
-    return out.astype(np.uint8)
-
-def hungarian_match(pred, gt):
-    """Map predicted labels to GT labels to maximize overlap (IoU)."""
-    import numpy as np
+    return colors
+
+@lru_cache(maxsize=32)
+def overlay_lut(num_classes, alpha=0.5):
+    """(256 * num_classes, 3) uint8 table: row g*num_classes + c = gray g blended with colour of class c."""
+    colors = np.array(class_colors(num_classes), dtype=np.float32)
+    g = np.arange(256, dtype=np.float32)[:, None, None]
+    # cùng phép tính float32 như khi blend trên từng điểm ảnh -> kết quả giống hệt
+    lut = ((1 - alpha) * g + alpha * colors[None]).astype(np.uint8).reshape(-1, 3)
+    lut.setflags(write=False)
+    return lut
+
+def overlay_mask(img_gray, seg, alpha=0.5, num_classes=None, out=None):
+    """Overlay of seg on a uint8 gray image (one gather from a (gray, label) palette LUT).
+
+    num_classes defaults to seg.max()+1; out: optional (H, W, 3) uint8 buffer to render into.
+    """
+    if num_classes is None:
+        num_classes = int(seg.max()) + 1
+    lut = overlay_lut(int(num_classes), float(alpha))
+    idx = np.asarray(img_gray, dtype=np.intp) * num_classes
+    idx += seg
+    return np.take(lut, idx, axis=0, mode='clip', out=out)
+
+def hungarian_match(pred, gt, cm=None):
+    """Map predicted labels to GT labels to maximize overlap (IoU).
+
+    cm: confusion matrix of (pred, gt) from metrics.confusion_matrix, if already computed.
+    """
     from scipy.optimize import linear_sum_assignment
+    from .metrics import confusion_matrix, hungarian_cost
 
-    n_pred = int(pred.max()) + 1
-    n_gt = int(gt.max()) + 1
-    n = max(n_pred, n_gt)
-    cost = np.ones((n, n), dtype=np.float64)
-    for i in range(n_pred):
-        Pi = (pred == i)
-        for j in range(n_gt):
-            Gj = (gt == j)
-            inter = np.logical_and(Pi, Gj).sum()
-            union = Pi.sum() + Gj.sum() - inter
-            iou = inter / (union + 1e-9)
-            cost[i, j] = 1.0 - iou
+    if cm is None:
+        cm = confusion_matrix(pred, gt)
+    cost = hungarian_cost(cm)
     row_ind, col_ind = linear_sum_assignment(cost)
-    perm = np.arange(n, dtype=np.int32)
+    perm = np.arange(cost.shape[0], dtype=np.int32)
     perm[row_ind] = col_ind
     return perm
+
+def append_csv_rows(path, rows):
+    import csv
+    with open(path, "a", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+class AsyncWriter:
+    """Runs output writes (image encoding, CSV appends) on background threads.
+
+    threads=0 writes synchronously. At most max_pending jobs wait in the queue (submit blocks
+    beyond that). CSV rows are buffered per file and appended in order every flush_rows rows,
+    when the oldest buffered row is flush_secs old, and on flush()/close(). The first error of a background job is re-raised by the next
+    submit() or by close().
+    """
+    def __init__(self, threads=2, max_pending=32, flush_rows=64, flush_secs=5.0):
+        import threading, time
+        from concurrent.futures import ThreadPoolExecutor
+        self._pool = ThreadPoolExecutor(threads) if threads > 0 else None
+        # một luồng riêng cho CSV -> các lô dòng được ghi đúng thứ tự
+        self._csv = ThreadPoolExecutor(1) if threads > 0 else None
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._rows = {}
+        self.flush_rows = flush_rows
+        self.flush_secs = flush_secs
+        self._clock = time.monotonic
+        self._since = {}
+        self._error = None
+        self._closed = False
+        self._pending = set()
+
+    def _check(self):
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+
+    def _done(self, fut, slot=True):
+        self._pending.discard(fut)
+        if slot:
+            self._slots.release()
+        if fut.exception() is not None and self._error is None:
+            self._error = fut.exception()
+
+    def submit(self, fn, *args, **kw):
+        self._check()
+        if self._pool is None:
+            fn(*args, **kw)
+            return
+        self._slots.acquire()
+        fut = self._pool.submit(fn, *args, **kw)
+        self._pending.add(fut)
+        fut.add_done_callback(self._done)
+
+    def write_row(self, path, row):
+        rows = self._rows.setdefault(path, [])
+        if not rows:
+            self._since[path] = self._clock()
+        rows.append(row)
+        if len(rows) >= self.flush_rows or self._clock() - self._since[path] >= self.flush_secs:
+            self._flush(path)
+
+    def _flush(self, path):
+        rows = self._rows.pop(path, None)
+        if not rows:
+            return
+        if self._csv is None:
+            append_csv_rows(path, rows)
+        else:
+            fut = self._csv.submit(append_csv_rows, path, rows)
+            self._pending.add(fut)
+            fut.add_done_callback(lambda f: self._done(f, slot=False))
+
+    def flush(self):
+        for path in list(self._rows):
+            self._flush(path)
+
+    def drain(self):
+        """flush() and wait for every job submitted so far; re-raises the first background error."""
+        from concurrent.futures import wait
+        self.flush()
+        wait(list(self._pending))
+        self._check()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        for ex in (self._pool, self._csv):
+            if ex is not None:
+                ex.shutdown(wait=True)
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except Exception:
+            if exc_type is None:
+                raise